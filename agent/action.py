@@ -1,3 +1,4 @@
+import sys
 from abc import ABC, abstractmethod
 import gv
 from entity import Entity
@@ -9,8 +10,12 @@ class Action(ABC):
     string.
 
     """
+    __slots__ = ('verb', '_key', '_tokens', '_key_version', '_recognized')
+
     def __init__(self, verb):
-        self.verb = verb
+        self.verb = sys.intern(verb)
+        self._key_version = -1
+        self._recognized  = None # (unrecognized version, name version, result)
 
     @abstractmethod
     def text(self):
@@ -26,36 +31,106 @@ class Action(ABC):
         """
         return None
 
-    def apply(self):
+    def apply(self, kg):
         """
-        Apply the action to the knowledge_graph. The effects of applying
+        Apply the action to the knowledge graph kg. The effects of applying
         depend on which action being applied.
 
         """
         pass
 
-    def recognized(self):
-        """ Returns true if action doesn't contain unrecognized words. """
-        for word in self.text().split(' '):
-            if word in gv.kg._unrecognized_words:
-                return False
-        return True
+    def _update_key(self):
+        """ Recomputes the canonical text and tokens of the action. """
+        self._key = sys.intern(self.text())
+        self._tokens = tuple(self._key.split(' '))
+        self._key_version = Entity.name_version
+
+    @property
+    def key(self):
+        """
+        Canonical text of the action. It is computed once and recomputed
+        only after an entity has been renamed.
+
+        """
+        if self._key_version != Entity.name_version:
+            self._update_key()
+        return self._key
+
+    @property
+    def tokens(self):
+        """ Tuple of the words in the action's text. """
+        if self._key_version != Entity.name_version:
+            self._update_key()
+        return self._tokens
+
+    def recognized(self, kg):
+        """
+        Returns true if action doesn't contain words that the knowledge
+        graph kg knows to be unrecognized. The result is cached until a new
+        unrecognized word is found or an entity is renamed.
+
+        Actions such as gv.North are shared by agents on different threads,
+        so the cache is one tuple, stored and read at once. Versions are
+        unique across graphs, so a result cached for another graph never
+        matches.
+
+        """
+        version, name_version = kg.unrecognized_version, Entity.name_version
+        cached = self._recognized
+        if cached is not None and cached[0] == version and cached[1] == name_version:
+            return cached[2]
+        result = kg._unrecognized_words.isdisjoint(self.tokens)
+        self._recognized = (version, name_version, result)
+        return result
+
+    def __getstate__(self):
+        """
+        Pickles the action with its current key. Entity.name_version only
+        counts within a process, so the key is marked current again on
+        unpickling; it can't be recomputed then, as the entities may not
+        be restored yet.
+
+        """
+        if self._key_version != Entity.name_version:
+            self._update_key()
+        return dict((slot, getattr(self, slot)) for cls in type(self).__mro__
+                    for slot in getattr(cls, '__slots__', ()) if hasattr(self, slot))
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        self._key_version = Entity.name_version
+        self._recognized  = None
 
     def __str__(self):
-        return self.text()
+        return self.key
 
     def __repr__(self):
         return self.__str__()
 
     def __hash__(self):
-        return hash(self.text())
+        if self._key_version != Entity.name_version:
+            self._update_key()
+        return hash(self._key)
 
     def __eq__(self, other):
-        return self.text() == other.text()
+        if self is other:
+            return True
+        version = Entity.name_version
+        if self._key_version != version:
+            self._update_key()
+        try:
+            if other._key_version != version:
+                other._update_key()
+        except AttributeError:
+            return NotImplemented
+        return self._key == other._key
 
 
 class StandaloneAction(Action):
     """ An action that doesn't require any entities. """
+    __slots__ = ()
+
     def __init__(self, verb):
         super().__init__(verb)
 
@@ -65,6 +140,8 @@ class StandaloneAction(Action):
 
 class SingleAction(Action):
     """ An action of the form: verb entity. """
+    __slots__ = ('entity',)
+
     def __init__(self, verb, entity):
         super().__init__(verb)
         if not isinstance(entity, Entity):
@@ -77,6 +154,8 @@ class SingleAction(Action):
 
 class DoubleAction(Action):
     """ An action of the form: verb Entity1 preposition Entity2 """
+    __slots__ = ('entity1', 'prep', 'entity2')
+
     def __init__(self, verb, entity1, preposition, entity2):
         super().__init__(verb)
         if not isinstance(entity1, Entity):
@@ -84,7 +163,7 @@ class DoubleAction(Action):
         if not isinstance(entity2, Entity):
             raise ValueError("Expected entity object, got {}".format(type(entity2)))
         self.entity1 = entity1
-        self.prep = preposition
+        self.prep = sys.intern(preposition)
         self.entity2 = entity2
 
     def text(self):
@@ -93,39 +172,45 @@ class DoubleAction(Action):
 
 
 class NavAction(StandaloneAction):
+    __slots__ = ()
+
     def __init__(self, verb):
         super().__init__(verb)
 
-    def apply(self):
-        to_loc = gv.kg.connections.navigate(gv.kg.player_location, self)
+    def apply(self, kg):
+        to_loc = kg.connections.navigate(kg.player_location, self)
         assert to_loc, "Error: Unknown connection"
-        gv.kg.player_location = to_loc
+        kg.player_location = to_loc
 
 
 class ExamineAction(Action):
+    __slots__ = ('entity_name',)
+
     def __init__(self, entity_name:str):
         super().__init__("examine")
-        self.entity_name = entity_name
+        self.entity_name = sys.intern(entity_name)
 
     def text(self):
         return "{} {}".format(self.verb, self.entity_name)
 
-    def apply(self):
+    def apply(self, kg):
         entity = Entity(self.entity, response)
-        gv.kg.player_location.add_entity(entity)
+        kg.player_location.add_entity(entity)
 
 
 class TakeAction(SingleAction):
+    __slots__ = ()
+
     def __init__(self, entity):
         super().__init__("take", entity)
 
-    def apply(self):
-        player_loc = gv.kg.player_location
+    def apply(self, kg):
+        player_loc = kg.player_location
         if player_loc.has_entity(self.entity):
             player_loc.del_entity(self.entity)
         else:
             gv.logger.warning("WARNING Took non-present entity {}".format(self.entity.name))
-        gv.kg.inventory.add_entity(self.entity)
+        kg.inventory.add_entity(self.entity)
         self.entity.add_attribute(gv.Portable)
 
     def validate(self, response_text):
@@ -137,18 +222,22 @@ class TakeAction(SingleAction):
 
 
 class TakeAllAction(StandaloneAction):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('take all')
 
 
 class DropAction(SingleAction):
+    __slots__ = ()
+
     def __init__(self, entity):
         super().__init__("drop", entity)
 
-    def apply(self):
-        assert self.entity in gv.kg.inventory
-        gv.kg.inventory.remove(self.entity)
-        gv.kg.player_location.add_entity(self.entity)
+    def apply(self, kg):
+        assert self.entity in kg.inventory
+        kg.inventory.remove(self.entity)
+        kg.player_location.add_entity(self.entity)
         self.entity.add_attribute(gv.Portable)
 
     def validate(self, response_text):
@@ -159,89 +248,109 @@ class DropAction(SingleAction):
 
 
 class OpenAction(SingleAction):
+    __slots__ = ()
+
     def __init__(self, entity):
         super().__init__("open", entity)
 
-    def apply(self):
+    def apply(self, kg):
         self.entity.state.open()
         self.entity.add_attribute(gv.Openable)
 
 
 class CloseAction(SingleAction):
+    __slots__ = ()
+
     def __init__(self, entity):
         super().__init__("close", entity)
 
-    def apply(self):
+    def apply(self, kg):
         self.entity.state.close()
         self.entity.add_attribute(gv.Openable)
 
 
 class LockAction(SingleAction):
+    __slots__ = ()
+
     def __init__(self, entity):
         super().__init__("lock", entity)
 
-    def apply(self):
+    def apply(self, kg):
         self.entity.state.lock()
         self.entity.add_attribute(gv.Lockable)
 
 class LockWithAction(DoubleAction):
+    __slots__ = ()
+
     def __init__(self, entity1, entity2):
         super().__init__("lock", entity1, "with", entity2)
 
-    def apply(self):
+    def apply(self, kg):
         self.entity1.state.lock()
         self.entity1.add_attribute(gv.Lockable)
 
 class UnlockAction(SingleAction):
+    __slots__ = ()
+
     def __init__(self, entity):
         super().__init__("unlock", entity)
 
-    def apply(self):
+    def apply(self, kg):
         self.entity.state.unlock()
         self.entity.add_attribute(gv.Lockable)
 
 class UnlockWithAction(DoubleAction):
+    __slots__ = ()
+
     def __init__(self, entity1, entity2):
         super().__init__("unlock", entity1, "with", entity2)
 
-    def apply(self):
+    def apply(self, kg):
         self.entity1.state.unlock()
         self.entity1.add_attribute(gv.Lockable)
 
 class TurnOnAction(SingleAction):
+    __slots__ = ()
+
     def __init__(self, entity):
         super().__init__("turn on", entity)
 
-    def apply(self):
+    def apply(self, kg):
         self.entity.state.turn_on()
         self.entity.add_attribute(gv.Switchable)
 
 
 class TurnOffAction(SingleAction):
+    __slots__ = ()
+
     def __init__(self, entity):
         super().__init__("turn off", entity)
 
-    def apply(self):
+    def apply(self, kg):
         self.entity.state.turn_off()
         self.entity.add_attribute(gv.Switchable)
 
 
 class ConsumeAction(SingleAction):
     """ An action that consumes the entity. """
+    __slots__ = ()
+
     def __init__(self, verb, entity):
         super().__init__(verb, entity)
 
-    def apply(self):
+    def apply(self, kg):
         self.entity.state.remove()
         self.entity.add_attribute(gv.Edible)
 
 
 class MoveItemAction(DoubleAction):
     """ An action that moves an item. """
+    __slots__ = ()
+
     def __init__(self, verb, entity1, prep, entity2):
         super().__init__(verb, entity1, prep, entity2)
 
-    def apply(self):
+    def apply(self, kg):
         # TODO: Should entity contain a reference to its own container?
         # move_entity(self.entity1, source_container, self.entity2)
         pass
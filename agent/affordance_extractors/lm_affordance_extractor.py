@@ -1,9 +1,10 @@
-import os, sys, math
+import os, sys, math, threading
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from affordance_extractor import AffordanceExtractor
 from gv import Take, Open, Eat, Drink, Move, Push, Pull, Lift, TurnOn, TurnOff, Light, Extinguish, Open, Close, Lock, Unlock, Search, Ask, Talk, Kiss, Bribe, Attack, Kill
-from gv import rng
 import action
+import util
+from timing import timed
 from ctypes import *
 from action import DoubleAction
 
@@ -28,6 +29,50 @@ complex_verbs = [
 ]
 
 
+# The language model is read-only, so one copy is shared by every extractor
+# and stays open for the life of the process.
+_language_model      = None # (lib, model)
+_language_model_lock = threading.Lock()
+
+# Serializes queries of the shared model. The reader keeps an internal cache
+# (see open_language_model) that isn't known to be thread-safe, and ctypes
+# releases the GIL during the call.
+_query_lock = threading.Lock()
+
+# Joint log probabilities of recent (model, string, order) queries, shared by
+# every extractor since agents score the same nouns and verb phrases.
+_joint_log_probs = util.LruCache(100000, 'lm')
+
+
+def configure_ctypes(lib):
+    lib.NgramTrieLM_Open.argtypes = [c_char_p, c_int, c_int]
+    lib.NgramTrieLM_Open.restype = c_void_p
+
+    lib.NgramTrieLM_Close.argtypes = [c_void_p]
+    lib.NgramTrieLM_Close.restype = None
+
+    lib.NgramTrieLM_GetJointProb.argtypes = [c_void_p, c_char_p, c_int]
+    lib.NgramTrieLM_GetJointProb.restype = c_uint
+
+
+def open_language_model(lib, path):
+    if not os.path.isfile(path + '.utrie'):
+        print("Language model not found. Please follow the README steps to download it.")
+    model = lib.NgramTrieLM_Open(path.encode('utf-8'), 0, 512)
+    return model
+
+
+def load_language_model():
+    """ Returns the shared (lib, model) pair, loading it on first use. """
+    global _language_model
+    with _language_model_lock:
+        if _language_model is None:
+            lib = CDLL(LM_READER_PATH)
+            configure_ctypes(lib)
+            _language_model = (lib, open_language_model(lib, FORWARD_LM_PATH))
+    return _language_model
+
+
 class AffordableAttribute:
     def __init__(self, attribute_name, detection_verbs):
         self.attribute_name = attribute_name
@@ -40,14 +85,17 @@ class AffordableAttribute:
 
 class LmAffordanceExtractor(AffordanceExtractor):
     """
-    Uses an ngram language model to extract affordances.
+    Uses an ngram language model to extract affordances. The model is
+    shared; the extraction caches belong to the extractor.
+
+    @args
+    rng: Random number generator of the agent using the extractor
 
     """
-    def __init__(self):
+    def __init__(self, rng):
         super().__init__()
-        self.lib = CDLL(LM_READER_PATH)
-        self.configure_ctypes(self.lib)
-        self.forward_model = self.open_language_model(FORWARD_LM_PATH)
+        self.rng = rng
+        self.lib, self.forward_model = load_language_model()
         self.affordable_attributes = []
         self.affordable_attributes_by_name = {}
         self.attribute_probs = {}
@@ -70,28 +118,33 @@ class LmAffordanceExtractor(AffordanceExtractor):
         self.filtered_action_list = []
         self.read_action_priors()
 
-    def __del__(self):
-        self.lib.NgramTrieLM_Close(self.forward_model)
-
-    def configure_ctypes(self, lib):
-        lib.NgramTrieLM_Open.argtypes = [c_char_p, c_int, c_int]
-        lib.NgramTrieLM_Open.restype = c_void_p
-
-        lib.NgramTrieLM_Close.argtypes = [c_void_p]
-        lib.NgramTrieLM_Close.restype = None
-
-        lib.NgramTrieLM_GetJointProb.argtypes = [c_void_p, c_char_p, c_int]
-        lib.NgramTrieLM_GetJointProb.restype = c_uint
-
-    def open_language_model(self, path):
-        if not os.path.isfile(path + '.utrie'):
-            print("Language model not found. Please follow the README steps to download it.")
-        model = self.lib.NgramTrieLM_Open(path.encode('utf-8'), 0, 512)
-        return model
+    def __getstate__(self):
+        # The model is shared and the affordable attributes refer to the
+        # action constructors of gv, so both are rebuilt on unpickling.
+        state = self.__dict__.copy()
+        for name in ('lib', 'forward_model', 'affordable_attributes',
+                     'affordable_attributes_by_name', 'unknown_actions_to_promote'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lib, self.forward_model = load_language_model()
+        self.affordable_attributes = []
+        self.affordable_attributes_by_name = {}
+        self.init_affordable_attributes()
+        self.get_log_prob_calibration_thresholds()
 
+    @timed('LmAffordanceExtractor.get_joint_log_prob')
     def get_joint_log_prob(self, model, string, order):
-        encoded_log_prob = self.lib.NgramTrieLM_GetJointProb(model, string.encode('utf-8'), order)
-        return encoded_log_prob / -1000.
+        key = (model, string, order)
+        log_prob = _joint_log_probs.get(key)
+        if log_prob is None:
+            with _query_lock:
+                encoded_log_prob = self.lib.NgramTrieLM_GetJointProb(model, string.encode('utf-8'), order)
+            log_prob = encoded_log_prob / -1000.
+            _joint_log_probs.put(key, log_prob)
+        return log_prob
 
     def read_action_priors(self):
         action_priors_file = open(ACTION_PRIORS_PATH, 'r')
@@ -104,8 +157,8 @@ class LmAffordanceExtractor(AffordanceExtractor):
         action_priors_file.close()
 
     def extract_single_object_actions(self, entity):
-        if id(entity) in self.cached_extractions:
-            return self.cached_extractions[id(entity)]
+        if entity in self.cached_extractions:
+            return self.cached_extractions[entity]
 
         # Collect known actions for the given entity.
         noun = entity.name
@@ -134,7 +187,7 @@ class LmAffordanceExtractor(AffordanceExtractor):
                 action_minus_the = action_text[:-4]
                 if action_minus_the not in unknown_actions_to_exclude.keys():
                     if action_minus_the in self.unknown_actions_to_promote:
-                        target_action = rng.choice(self.unknown_actions_to_promote[action_minus_the])
+                        target_action = self.rng.choice(self.unknown_actions_to_promote[action_minus_the])
                         action_object = target_action(entity)
                     else:
                         action_object = action.SingleAction(action_text, entity)
@@ -142,11 +195,11 @@ class LmAffordanceExtractor(AffordanceExtractor):
 
         # Sort by descending probability of expected value of taking the action.
         actions_to_try.sort(key=lambda tup: tup[1], reverse=True)
-        self.cached_extractions[id(entity)] = actions_to_try
+        self.cached_extractions[entity] = actions_to_try
         return actions_to_try
 
     def extract_double_object_actions(self, entity1, entity2):
-        key = (id(entity1), id(entity2))
+        key = (entity1, entity2)
         if key in self.cached_double_object_actions:
             return self.cached_double_object_actions[key]
 
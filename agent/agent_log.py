@@ -0,0 +1,95 @@
+import os, sys, gzip, queue, shutil, logging, threading
+from logging.handlers import QueueHandler, RotatingFileHandler
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import gv
+
+# Components log to the child loggers nail.<component>; see gv.component_dbg.
+COMPONENTS = ['agent', 'events', 'kg', 'util', 'checkpoint', 'examiner', 'hoarder',
+              'navigator', 'interactor', 'idler', 'you_have_to', 'darkness', 'restart']
+
+# (file handler, record) pairs of every agent in the process, written by
+# one background thread.
+_records = queue.SimpleQueue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _write_loop():
+    while True:
+        handler, record = _records.get()
+        if isinstance(record, threading.Event):
+            handler.close()
+            record.set()
+        else:
+            handler.handle(record)
+
+
+def _start_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name='nail-log-writer', daemon=True)
+            _writer.start()
+
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def set_levels(default=None, levels=None):
+    """
+    Sets how much is logged, for every agent in the process. default is the
+    level of every component, levels maps component names to their own
+    level, e.g. {'navigator': 'INFO'}. Levels are names or logging levels.
+
+    """
+    if default is not None:
+        gv.logger.setLevel(default)
+    for component, level in (levels or {}).items():
+        if component not in COMPONENTS:
+            raise ValueError("Unknown log component {}, expected one of {}".format(
+                component, ', '.join(COMPONENTS)))
+        gv.logger.getChild(component).setLevel(level)
+
+
+class AgentLogHandler(QueueHandler):
+    """
+    Sends the log records of one agent to its log file. The agent's thread
+    only queues each record; a shared background thread formats and writes
+    it, so logging never waits on the disk.
+
+    @args
+    path: Path of the log file
+    record_filter: Called with each record; only records it accepts are logged
+    mode: 'w' to start a new file, 'a' to append, e.g. on resume
+    max_bytes: Rotate the file once it would grow beyond this size; 0 never rotates
+    backups: Number of rotated files kept, as path.1, path.2, ...
+    compress: Gzip the rotated files
+
+    """
+    def __init__(self, path, record_filter, mode='w', max_bytes=0, backups=5, compress=False):
+        super().__init__(_records)
+        self.file_handler = RotatingFileHandler(path, mode=mode, maxBytes=max_bytes,
+                                                backupCount=backups, delay=True)
+        self.file_handler.setFormatter(logging.Formatter('%(message)s'))
+        if compress:
+            self.file_handler.namer = lambda name: name + '.gz'
+            self.file_handler.rotator = _gzip_rotator
+        self.addFilter(record_filter)
+        _start_writer()
+
+    def prepare(self, record):
+        # Formatting is left to the writer thread.
+        return record
+
+    def enqueue(self, record):
+        self.queue.put((self.file_handler, record))
+
+    def close(self):
+        """ Waits for the queued records to be written, then closes the file. """
+        closed = threading.Event()
+        self.queue.put((self.file_handler, closed))
+        closed.wait()
+        super().close()
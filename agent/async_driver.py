@@ -0,0 +1,65 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncDriver:
+    """
+    Runs many games concurrently on one asyncio event loop.
+
+    Each game is a coroutine running the usual take_action, env.step and
+    observe loop. Agent steps, and the model inference inside them, run on
+    a pool of threads. Emulator steps run on a separate thread. So while one
+    game waits for the emulator, another can be choosing its action.
+
+    The calls of one game still happen strictly in order, and every agent
+    has its own context and rng, so each game's trajectory is the same as
+    when it runs alone.
+
+    @args
+    workers: Number of threads running agent steps
+    env_workers: Number of threads running emulator steps. The emulator is
+                 not known to be thread-safe, so by default all environments
+                 share one thread.
+
+    """
+    def __init__(self, workers=4, env_workers=1):
+        self.executor     = ThreadPoolExecutor(workers, thread_name_prefix='nail-agent')
+        self.env_executor = ThreadPoolExecutor(env_workers, thread_name_prefix='nail-env')
+
+    async def run_game(self, agent, env, steps):
+        """ Runs one game for the given number of steps. Returns (final score, best score). """
+        loop = asyncio.get_running_loop()
+        obs = await loop.run_in_executor(self.env_executor, env.reset)
+        score = max_score = 0
+        for _ in range(steps):
+            action = await agent.take_action_async(obs, self.executor)
+            new_obs, score, done, info = await loop.run_in_executor(
+                self.env_executor, env.step, action)
+            max_score = max(max_score, score)
+            await agent.observe_async(obs, action, score, new_obs, done, self.executor)
+            obs = new_obs
+            if done:
+                obs = await loop.run_in_executor(self.env_executor, env.reset)
+        return score, max_score
+
+    async def run_games(self, agents, envs, steps):
+        """
+        Runs every game concurrently. Returns the (final score, best score) of
+        each game, or the exception it failed with; a failed game doesn't
+        stop the others.
+
+        """
+        return await asyncio.gather(*[self.run_game(agent, env, steps)
+                                      for agent, env in zip(agents, envs)],
+                                    return_exceptions=True)
+
+    def run(self, agents, envs, steps):
+        """ Runs every game to completion on a new event loop. """
+        try:
+            return asyncio.run(self.run_games(agents, envs, steps))
+        finally:
+            self.close()
+
+    def close(self):
+        self.executor.shutdown()
+        self.env_executor.shutdown()
@@ -1,4 +1,10 @@
 
+def global_attribute(name):
+    """ Returns the attribute defined in gv with the given name. """
+    import gv
+    return next(a for a in vars(gv).values() if isinstance(a, Attribute) and a.name == name)
+
+
 class Attribute:
     """An attribute describes an object and provides a list of actions
     applicable to that object.
@@ -8,5 +14,9 @@ class Attribute:
         self.name = name
         self.afforded_actions = afforded_actions
 
+    def __reduce__(self):
+        # Attributes are the shared globals of gv, so they pickle by name.
+        return (global_attribute, (self.name,))
+
     def to_string(self, prefix=''):
         return prefix + self.name
@@ -0,0 +1,81 @@
+import os, sys, random, time, contextvars
+from contextlib import contextmanager
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# The AgentContext active on the current thread or asyncio task.
+_active = contextvars.ContextVar('nail_agent_context')
+
+
+class AgentContext:
+    """
+    The mutable state of one agent: its knowledge graph, event stream, random
+    number generator, text pool, optional knowledge graph recorder and
+    phase timer, and the deadline of the current step.
+
+    Read-only resources such as spaCy (gv.nlp), the fastText validity model
+    and the language model are loaded once per process and shared by every
+    context, so many agents can run side by side in one process.
+
+    Decision modules, actions and the knowledge graph are handed their
+    context explicitly. Entities, locations and events report changes to the
+    active context instead, which NailAgent sets for the duration of each
+    step:
+
+        with ctx.activate():
+            ...
+
+    """
+    __slots__ = ('kg', 'event_stream', 'rng', 'text_pool', 'kg_recorder', 'timer', 'deadline')
+
+    def __init__(self, seed=None):
+        from event import EventStream
+        from knowledge_graph import KnowledgeGraph
+        from util import TextPool
+        self.rng          = random.Random(seed)
+        self.event_stream = EventStream()
+        self.text_pool    = TextPool()
+        self.kg_recorder  = None # Set to a KnowledgeGraphRecorder to record snapshots
+        self.timer        = None # Set to a timing.PhaseTimer to time the steps
+        self.deadline     = None # time.perf_counter() by which the step should end
+        with self.activate():
+            self.kg = KnowledgeGraph(self)
+
+    def __getstate__(self):
+        state = dict((slot, getattr(self, slot)) for slot in self.__slots__)
+        state['kg_recorder'] = None # Writes to the file of the original run
+        state['deadline']    = None
+        return state
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+    def out_of_time(self):
+        """ Returns true if the current step has a deadline and it has passed. """
+        return self.deadline is not None and time.perf_counter() > self.deadline
+
+    @contextmanager
+    def activate(self):
+        """ Makes this the active context on the current thread or task. """
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+
+def active():
+    """
+    Returns the active AgentContext. Raises RuntimeError if none is, as the
+    changes made would otherwise belong to no agent.
+
+    """
+    try:
+        return _active.get()
+    except LookupError:
+        raise RuntimeError("No AgentContext is active; use ctx.activate()") from None
+
+
+def current():
+    """ Returns the active AgentContext, or None for code that also runs outside agents. """
+    return _active.get(None)
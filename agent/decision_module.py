@@ -1,5 +1,4 @@
 from abc import ABC, abstractmethod
-import gv
 
 class DecisionModule(ABC):
     """
@@ -11,15 +10,25 @@ class DecisionModule(ABC):
     conditioned on observations. A module in control remains in control until it
     stops generating actions, at which point the most eager module takes over.
 
+    @args
+    ctx: The AgentContext of the agent the module belongs to
+
     """
-    def __init__(self):
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.kg = ctx.kg
+        self.rng = ctx.rng
         self._eagerness = 0.
         self._succ_cnt = 0
         self._fail_cnt = 0
 
     def process_event_stream(self):
-        for event in gv.event_stream.read():
-            self.process_event(event)
+        timer = self.ctx.timer
+        for event in self.ctx.event_stream.read():
+            if timer is None:
+                self.process_event(event)
+            else:
+                timer.call(type(self).__name__ + '.process_event', self.process_event, event)
 
 
     def get_eagerness(self):
@@ -2,20 +2,22 @@ import os, sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from valid_detectors.learned_valid_detector import LearnedValidDetector
 from decision_module import DecisionModule
-from gv import dbg, rng
+from gv import component_dbg
 from action import StandaloneAction
 from event import NewTransitionEvent
 from util import first_sentence
 
+dbg = component_dbg('darkness')
+
 class Darkness(DecisionModule):
     """
     The Darkness module listens for phrases like 'it's pitch black' and tries to turn on a light.
 
     """
-    def __init__(self, active=False):
-        super().__init__()
+    def __init__(self, ctx, active=False):
+        super().__init__(ctx)
         self._active = active
-        self._valid_detector = LearnedValidDetector()
+        self._valid_detector = LearnedValidDetector(ctx.kg)
         self.queries = ['pitch black', 'too dark to see']
 
     def process_event(self, event):
@@ -1,4 +1,5 @@
 import os, sys
+from collections import deque
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from entity_detectors.spacy_entity_detector import SpacyEntityDetector
 from valid_detectors.learned_valid_detector import LearnedValidDetector
@@ -6,21 +7,28 @@ from decision_module import DecisionModule
 from event import *
 from knowledge_graph import *
 from action import *
-from gv import kg, dbg, rng
+from gv import component_dbg
 from util import clean, first_sentence
 
+dbg = component_dbg('examiner')
+
 class Examiner(DecisionModule):
     """
     Examiner is responsible for gathering information from the environment
     by issuing the examine command on objects present at a location.
 
+    When the step has a deadline that has passed, detecting candidate
+    entities in new text is put off until a later step has time for it.
+    At most max_deferred detections wait; beyond that the oldest are dropped.
+
     """
-    def __init__(self, active=False):
-        super().__init__()
+    def __init__(self, ctx, active=False, max_deferred=100):
+        super().__init__(ctx)
         self._active = active
-        self._valid_detector = LearnedValidDetector()
+        self._valid_detector = LearnedValidDetector(ctx.kg)
         self._entity_detector = SpacyEntityDetector()
         self._to_examine = {} # Location : ['entity1', 'entity2']
+        self._deferred = deque(maxlen=max_deferred) # (Location, message) put off by deadlines
         self._validation_threshold = 0.5  # Best threshold over 16 seeds, but not very sensitive.
         self._high_eagerness = 0.9
         self._low_eagerness = 0.11
@@ -34,11 +42,13 @@ class Examiner(DecisionModule):
     def get_event_info(self, event):
         """ Returns the location and information contained by a new event. """
         message = ''
-        location = kg.player_location
+        location = self.kg.player_location
         if type(event) is NewLocationEvent:
             location = event.new_location
             message = event.new_location.description
         elif type(event) is NewEntityEvent:
+            # Entities of a loaded graph are discovered before the player is placed.
+            location = location or event.new_entity._init_loc
             message = event.new_entity.description
         elif type(event) is NewActionRecordEvent:
             message = event.result_text
@@ -47,6 +57,13 @@ class Examiner(DecisionModule):
         return location, message
 
 
+    def process_event_stream(self):
+        """ Catches up on deferred detections while there is time, then processes new events. """
+        while self._deferred and not self.ctx.out_of_time():
+            self.detect(*self._deferred.popleft())
+        super().process_event_stream()
+
+
     def process_event(self, event):
         """ Process an event from the event stream. """
         location, message = self.get_event_info(event)
@@ -54,9 +71,21 @@ class Examiner(DecisionModule):
             self._to_examine[location] = []
         if not message:
             return
+        if self.ctx.out_of_time():
+            if (location, message) in self._deferred:
+                return
+            if len(self._deferred) == self._deferred.maxlen:
+                dbg("[EXM](dropped) {}".format(clean(self._deferred[0][1])))
+            self._deferred.append((location, message))
+            return
+        self.detect(location, message)
+
+
+    def detect(self, location, message):
+        """ Adds the entities detected in message to those to examine at location. """
         candidate_entities = self.detect_entities(message)
         dbg("[EXM](detect) {} --> {}".format(clean(message), candidate_entities))
-        self.filter(candidate_entities)
+        self.filter(candidate_entities, location)
 
 
     def get_eagerness(self):
@@ -65,26 +94,25 @@ class Examiner(DecisionModule):
             return 0.
         if self.get_descriptionless_entities():
             return self._high_eagerness
-        elif self._to_examine[kg.player_location]:
+        elif self._to_examine[self.kg.player_location]:
             return self._low_eagerness
         else:
             return 0.
 
 
     def get_descriptionless_entities(self):
-        l = [e for e in kg.player_location.entities if not e.description]
-        l.extend([e for e in kg.inventory if not e.description])
+        l = self.kg.descriptionless_entities(self.kg.player_location)
+        l.extend(self.kg.descriptionless_entities(self.kg.inventory))
         return l
 
 
-    def filter(self, candidate_entities):
-        """ Filters candidate entities. """
-        curr_loc = kg.player_location
+    def filter(self, candidate_entities, curr_loc):
+        """ Filters the candidate entities found at curr_loc. """
         for entity_name in candidate_entities:
             action = gv.Examine(entity_name)
             if curr_loc.has_entity_with_name(entity_name) or \
                action in curr_loc.action_records or \
-               not action.recognized() or \
+               not action.recognized(self.kg) or \
                entity_name in self._to_examine[curr_loc]:
                 continue
             self._to_examine[curr_loc].append(entity_name)
@@ -97,7 +125,7 @@ class Examiner(DecisionModule):
         3) Extract nested entities from detailed descriptions
         """
         obs = yield
-        curr_loc = kg.player_location
+        curr_loc = self.kg.player_location
         undescribed_entities = self.get_descriptionless_entities()
         if undescribed_entities:
             entity = undescribed_entities[0]
@@ -129,7 +157,7 @@ class Examiner(DecisionModule):
                     entity.add_name(entity_name)
             if success:
                 entity = curr_loc.get_entity_by_description(response)
-                inv_entity = kg.inventory.get_entity_by_description(response)
+                inv_entity = self.kg.inventory.get_entity_by_description(response)
                 if entity is None and inv_entity is None:
                     entity = Entity(entity_name, curr_loc, description=response)
                     # TODO: incorrect for entities discovered inside other entities
@@ -4,25 +4,27 @@ from decision_module import DecisionModule
 from event import *
 from knowledge_graph import *
 from action import *
-from gv import kg, dbg, rng
+from gv import component_dbg
+
+dbg = component_dbg('hoarder')
 
 
 class Hoarder(DecisionModule):
     """ The hoarder attempts to Take All """
-    def __init__(self, active=False):
-        super().__init__()
+    def __init__(self, ctx, active=False):
+        super().__init__(ctx)
         self._active = active
 
 
     def process_event(self, event):
         if not self._active:
             return
-        if type(event) is NewLocationEvent and gv.TakeAll.recognized():
+        if type(event) is NewLocationEvent and gv.TakeAll.recognized(self.kg):
             self._eagerness = 1.
 
 
     def parse_response(self, response):
-        here = gv.kg.player_location
+        here = self.kg.player_location
         success = False
         for line in response.splitlines():
             line = line.strip()
@@ -31,11 +33,9 @@ class Hoarder(DecisionModule):
                 # Example - small mailbox: It's securly anchored.
                 entity_name, resp = [w.strip() for w in line.split(':', 1)]
                 short_name = entity_name.split(' ')[-1]
-                if here.has_entity_with_name(entity_name):
-                    entity = here.get_entity_by_name(entity_name)
-                elif kg.inventory.has_entity_with_name(entity_name):
-                    entity = kg.inventory.get_entity_by_name(entity_name)
-                else:
+                entity = here.get_entity_by_name(entity_name) or \
+                    self.kg.inventory.get_entity_by_name(entity_name)
+                if entity is None:
                     # Create the entity at the current location
                     entity = Entity(entity_name, here)
                     entity.add_name(short_name)
@@ -46,7 +46,7 @@ class Hoarder(DecisionModule):
                 dbg("[Take] p={:.2f} {} --> {}".format(p_valid, entity_name, resp))
                 entity.add_action_record(take_action, p_valid, resp)
                 if p_valid > 0.5:
-                    take_action.apply()
+                    take_action.apply(self.kg)
         self.record(success)
 
 
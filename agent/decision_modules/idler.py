@@ -3,11 +3,13 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from valid_detectors.learned_valid_detector import LearnedValidDetector
 from decision_module import DecisionModule
 from action import StandaloneAction, SingleAction, DoubleAction
-from gv import kg, rng, dbg
+from gv import component_dbg
 from event import *
 from attribute import *
 from util import first_sentence
 
+dbg = component_dbg('idler')
+
 standalone_verbs = [
     'get all', 'take all', 'drop all', 'wait', 'yes',
     'look', 'in', 'out', 'climb', 'turn on', 'turn off',
@@ -66,10 +68,10 @@ class Idler(DecisionModule):
     """
     The Idler module accepts control when no others are willing to.
     """
-    def __init__(self, active=False):
-        super().__init__()
+    def __init__(self, ctx, active=False):
+        super().__init__(ctx)
         self._active = active
-        self._valid_detector = LearnedValidDetector()
+        self._valid_detector = LearnedValidDetector(ctx.kg)
         self._eagerness = .05
 
 
@@ -80,25 +82,25 @@ class Idler(DecisionModule):
 
     def get_random_entity(self):
         """ Returns a random entity from the location or inventory. """
-        if kg.player_location.entities or kg.inventory.entities:
-            return rng.choice(kg.player_location.entities + kg.inventory.entities)
+        if self.kg.player_location.entities or self.kg.inventory.entities:
+            return self.rng.choice(self.kg.player_location.entities + self.kg.inventory.entities)
         return None
 
 
     def get_standalone_action(self):
-        return StandaloneAction(rng.choice(standalone_verbs))
+        return StandaloneAction(self.rng.choice(standalone_verbs))
 
 
     def get_single_object_action(self):
         entity = self.get_random_entity()
         if not entity:
             return None
-        verb = rng.choice(single_object_verbs)
+        verb = self.rng.choice(single_object_verbs)
         return SingleAction(verb, entity)
 
 
     def get_double_action(self):
-        if len(kg.player_location.entities) + len(kg.inventory.entities) <= 1:
+        if len(self.kg.player_location.entities) + len(self.kg.inventory.entities) <= 1:
             return None
         entity1 = None
         entity2 = None
@@ -110,14 +112,14 @@ class Idler(DecisionModule):
                 count += 1
             entity1 = self.get_random_entity()
             entity2 = self.get_random_entity()
-        verb, prep = rng.choice(complex_verbs)
+        verb, prep = self.rng.choice(complex_verbs)
         return DoubleAction(verb, entity1, prep, entity2)
 
 
     def get_action(self):
         if not self._active:
             return StandaloneAction('look')
-        n = rng.random()
+        n = self.rng.random()
         if n < .1:
             return self.get_standalone_action()
         elif n < .8:
@@ -129,12 +131,12 @@ class Idler(DecisionModule):
     def take_control(self):
         obs = yield
         action = self.get_action()
-        while action is None or not action.recognized():
+        while action is None or not action.recognized(self.kg):
             action = self.get_action()
         response = yield action
         p_valid = self._valid_detector.action_valid(action, first_sentence(response))
         if isinstance(action, StandaloneAction):
-            kg.player_location.add_action_record(action, p_valid, response)
+            self.kg.player_location.add_action_record(action, p_valid, response)
         elif isinstance(action, SingleAction):
             action.entity.add_action_record(action, p_valid, response)
         elif isinstance(action, DoubleAction):
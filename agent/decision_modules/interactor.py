@@ -3,23 +3,31 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from valid_detectors.learned_valid_detector import LearnedValidDetector
 from affordance_extractors.lm_affordance_extractor import LmAffordanceExtractor
 from decision_module import DecisionModule
-from gv import kg, event_stream, dbg, rng
+from gv import component_dbg
 from event import *
 from attribute import *
 from util import clean, first_sentence
 from action import SingleAction, DoubleAction
 
+dbg = component_dbg('interactor')
+
 
 class Interactor(DecisionModule):
     """
     The Interactor creates actions designed to interact with objects
     at the current location.
+
+    Scoring the affordances of new entities is the most expensive part of a
+    step. When the step has a deadline, get_eagerness stops scoring once it
+    has passed and reports the best action found so far. The scores are
+    cached by the affordance extractor, so the next step picks up where
+    this one stopped.
     """
-    def __init__(self, active=False):
-        super().__init__()
+    def __init__(self, ctx, active=False):
+        super().__init__(ctx)
         self._active = active
-        self._valid_detector = LearnedValidDetector()
-        self._affordance_extractor = LmAffordanceExtractor()
+        self._valid_detector = LearnedValidDetector(ctx.kg)
+        self._affordance_extractor = LmAffordanceExtractor(ctx.rng)
         self.best_action = None
         self._eagerness = 0.
         self.actions_that_caused_death = {}
@@ -35,28 +43,32 @@ class Interactor(DecisionModule):
         max_eagerness = 0.
 
         # Consider single-object actions.
-        for entity in kg.player_location.entities + kg.inventory.entities:
+        for entity in self.kg.player_location.entities + self.kg.inventory.entities:
+            if self.ctx.out_of_time():
+                return self.interrupted(max_eagerness)
             for action, prob in self._affordance_extractor.extract_single_object_actions(entity):
                 if prob <= max_eagerness:
                     break
                 if entity.has_action_record(action) or \
-                        (not action.recognized()) or \
+                        (not action.recognized(self.kg)) or \
                         (action in self.actions_that_caused_death) or \
-                        ((action.verb == 'take') and (entity in kg.inventory.entities)):  # Need to promote to Take.
+                        ((action.verb == 'take') and (entity in self.kg.inventory.entities)):  # Need to promote to Take.
                     continue
                 max_eagerness = prob
                 self.best_action = action
                 break
 
         # Consider double-object actions.
-        for entity1 in kg.player_location.entities + kg.inventory.entities:
-            for entity2 in kg.player_location.entities + kg.inventory.entities:
+        for entity1 in self.kg.player_location.entities + self.kg.inventory.entities:
+            for entity2 in self.kg.player_location.entities + self.kg.inventory.entities:
                 if entity1 != entity2:
+                    if self.ctx.out_of_time():
+                        return self.interrupted(max_eagerness)
                     for action, prob in self._affordance_extractor.extract_double_object_actions(entity1, entity2):
                         if prob <= max_eagerness:
                             break
                         if entity1.has_action_record(action) or \
-                                (not action.recognized()) or \
+                                (not action.recognized(self.kg)) or \
                                 (action in self.actions_that_caused_death):
                             continue
                         max_eagerness = prob
@@ -66,6 +78,12 @@ class Interactor(DecisionModule):
         self._eagerness = max_eagerness
         return self._eagerness
 
+    def interrupted(self, max_eagerness):
+        """ Settles for the best action found before the deadline. """
+        dbg("[INT] Out of time, best so far: {} {}".format(self.best_action, max_eagerness))
+        self._eagerness = max_eagerness
+        return self._eagerness
+
     def take_control(self):
         obs = yield
 
@@ -90,7 +108,7 @@ class Interactor(DecisionModule):
         success = (p_valid > 0.5)
         self.record(success)
         if success:
-            action.apply()
+            action.apply(self.kg)
         dbg("[INT]({}) p={:.2f} {} --> {}".format(
             "val" if success else "inv", p_valid, action, response))
 
@@ -7,6 +7,8 @@ from fuzzywuzzy import fuzz
 from gv import *
 from util import tokenize
 
+dbg = component_dbg('navigator')
+
 
 class Navigator(DecisionModule):
     """
@@ -18,14 +20,12 @@ class Navigator(DecisionModule):
     eagerness: Default eagerness for this module
 
     """
-    def __init__(self, active=False, p_retry=.3):
-        super().__init__()
+    def __init__(self, ctx, active=False, p_retry=.3):
+        super().__init__(ctx)
         self._active = active
-        self._nav_actions = [North, South, West, East, NorthWest,
-                             SouthWest, NorthEast, SouthEast, Up,
-                             Down, Enter, Exit]
+        self._nav_actions = NavActions
         self._p_retry = p_retry
-        self._valid_detector = LearnedValidDetector()
+        self._valid_detector = LearnedValidDetector(ctx.kg)
         self._suggested_directions = []
         self._default_eagerness = 0.1
         self._low_eagerness = 0.01
@@ -45,27 +45,26 @@ class Navigator(DecisionModule):
     def get_eagerness(self):
         if not self._active:
             return 0.
-        if self.get_unexplored_actions(kg.player_location):
+        if self.get_unexplored_actions(self.kg.player_location):
             return self._default_eagerness
-        return rng.choice([self._low_eagerness, self._default_eagerness])
+        return self.rng.choice([self._low_eagerness, self._default_eagerness])
 
 
     def get_unexplored_actions(self, location):
         """ Returns a list of nav actions not yet attempted from a given location. """
-        return [act for act in self._nav_actions if act not in location.action_records \
-                and act.recognized()]
+        return self.kg.untried_nav_actions(location)
 
 
     def get_successful_nav_actions(self, location):
         """ Returns a list of nav actions that have been successful from the location. """
-        return [c.action for c in kg.connections.outgoing(location) if c.action.recognized()]
+        return [c.action for c in self.kg.connections.outgoing(location) if c.action.recognized(self.kg)]
 
 
     def get_failed_nav_actions(self, location):
         """ Returns a list of nav actions that have failed from the location. """
         successful_actions = self.get_successful_nav_actions(location)
         return [act for act in self._nav_actions if act in location.action_records \
-                and act not in successful_actions and act.recognized()]
+                and act not in successful_actions and act.recognized(self.kg)]
 
 
     def get_action(self):
@@ -74,11 +73,11 @@ class Navigator(DecisionModule):
         of the successful or failed nav actions.
 
         """
-        loc = kg.player_location
+        loc = self.kg.player_location
 
         # If there was a previously suggested direction, try it
         if self._suggested_directions:
-            act = rng.choice(self._suggested_directions)
+            act = self.rng.choice(self._suggested_directions)
             del self._suggested_directions[:]
             dbg("[NAV] Trying suggested action: {}".format(act))
             return act
@@ -93,20 +92,20 @@ class Navigator(DecisionModule):
         # Then try something new
         unexplored = self.get_unexplored_actions(loc)
         if unexplored:
-            act = rng.choice(unexplored)
+            act = self.rng.choice(unexplored)
             dbg("[NAV] Trying unexplored action: {}".format(act))
             return act
 
         # Try a previously successful action
-        if rng.random() > self._p_retry:
+        if self.rng.random() > self._p_retry:
             successful_actions = self.get_successful_nav_actions(loc)
             if successful_actions:
-                act = rng.choice(successful_actions)
+                act = self.rng.choice(successful_actions)
                 dbg("[NAV] Trying previously successful action: {}".format(act))
                 return act
 
         # Finally, just try something random
-        act = rng.choice(self._nav_actions)
+        act = self.rng.choice(self._nav_actions)
         dbg("[NAV] Trying random action: {}".format(act))
         return act
 
@@ -114,23 +113,16 @@ class Navigator(DecisionModule):
     def find_most_similar_loc(self, description, loc_list):
         """Returns the location from loc_list with that best matches the
         provided description."""
-        most_similar = None
-        best_similarity = 0
-        for loc in loc_list:
-            similarity = fuzz.partial_ratio(loc.description, description)
-            if similarity > best_similarity:
-                best_similarity = similarity
-                most_similar = loc
-        return most_similar
+        return self.kg.most_similar_location(description, loc_list)
 
 
     def relocalize(self, description):
         """Resets the player's location to location best matching the
         provided description, creating a new location if needed. """
-        loc = kg.most_similar_location(description)
+        loc = self.kg.most_similar_location(description)
         if loc:
             dbg("[NAV](relocalizing) \"{}\" to {}".format(description, loc))
-            kg.player_location = loc
+            self.kg.player_location = loc
         else:
             dbg("[NAV](relocalizing aborted) \"{}\" to {}".format(description, loc))
 
@@ -141,7 +133,7 @@ class Navigator(DecisionModule):
 
         """
         obs = yield
-        curr_loc = kg.player_location
+        curr_loc = self.kg.player_location
         action = self.get_action()
         response = yield action
         p_valid = self._valid_detector.action_valid(action, response)
@@ -162,7 +154,7 @@ class Navigator(DecisionModule):
 
         # If an existing locations matches the response, then we're done
         possible_loc_name = Location.extract_name(response)
-        existing_locs = kg.locations_with_name(possible_loc_name)
+        existing_locs = self.kg.locations_with_name(possible_loc_name)
         if existing_locs:
             # If multiple locations match, we need the most similar
             if len(existing_locs) > 1:
@@ -171,13 +163,13 @@ class Navigator(DecisionModule):
             else:
                 existing_loc = existing_locs[0]
             dbg("[NAV](revisited-location) {}".format(existing_loc.name))
-            kg.add_connection(Connection(curr_loc, action, existing_loc))
-            kg.player_location = existing_loc
+            self.kg.add_connection(Connection(curr_loc, action, existing_loc))
+            self.kg.player_location = existing_loc
             return
 
         # This is either a new location or a failed action
         if tried_before:
-            known_destination = kg.connections.navigate(curr_loc, action)
+            known_destination = self.kg.connections.navigate(curr_loc, action)
             if known_destination:
                 # We didn't reach the expected destination. Likely mislocalized.
                 look = yield Look
@@ -201,19 +193,19 @@ class Navigator(DecisionModule):
             if moved:
                 # Check if we've moved to an existing location
                 possible_loc_name = Location.extract_name(look)
-                existing_locs = kg.locations_with_name(possible_loc_name)
+                existing_locs = self.kg.locations_with_name(possible_loc_name)
                 if existing_locs:
                     if len(existing_locs) > 1:
                         existing_loc = self.find_most_similar_loc(look, existing_locs)
                     else:
                         existing_loc = existing_locs[0]
                     dbg("[NAV](revisited-location) {}".format(existing_loc.name))
-                    kg.add_connection(Connection(curr_loc, action, existing_loc))
-                    kg.player_location = existing_loc
+                    self.kg.add_connection(Connection(curr_loc, action, existing_loc))
+                    self.kg.player_location = existing_loc
                     return
 
                 # Finally, create a new location
                 new_loc = Location(look)
-                to_loc = kg.add_location(new_loc)
-                kg.add_connection(Connection(curr_loc, action, new_loc))
-                kg.player_location = new_loc
+                to_loc = self.kg.add_location(new_loc)
+                self.kg.add_connection(Connection(curr_loc, action, new_loc))
+                self.kg.player_location = new_loc
@@ -1,17 +1,19 @@
 import os, sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from decision_module import DecisionModule
-from gv import dbg, kg
+from gv import component_dbg
 from action import StandaloneAction
 from event import NewTransitionEvent
 
+dbg = component_dbg('restart')
+
 class Restart(DecisionModule):
     """
     The Restart module listens for a game over and will restart the game.
 
     """
-    def __init__(self, active=False):
-        super().__init__()
+    def __init__(self, ctx, active=False):
+        super().__init__(ctx)
         self._active = active
 
 
@@ -34,5 +36,5 @@ class Restart(DecisionModule):
         dbg("[RESTART] Restarting Game")
         action = StandaloneAction("IEEECIG-ADVENT-RESTART-COMMAND")
         response = yield action
-        kg.reset()
+        self.kg.reset()
         self._eagerness = 0.
@@ -2,7 +2,7 @@ import os, sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from valid_detectors.learned_valid_detector import LearnedValidDetector
 from decision_module import DecisionModule
-from gv import Yes, No, rng
+from gv import Yes, No
 from event import NewTransitionEvent
 from util import first_sentence
 
@@ -11,10 +11,10 @@ class YesNo(DecisionModule):
     The YesNo module listens for Yes/No questions and always outputs Yes.
 
     """
-    def __init__(self, active=False):
-        super().__init__()
+    def __init__(self, ctx, active=False):
+        super().__init__(ctx)
         self._active = active
-        self._valid_detector = LearnedValidDetector()
+        self._valid_detector = LearnedValidDetector(ctx.kg)
         self.query1 = "yes or n"
         self.query2 = "y/n"
         self.query3 = "(y or n)"
@@ -34,7 +34,7 @@ class YesNo(DecisionModule):
     def take_control(self):
         """ Always answers yes """
         obs = yield
-        action = rng.choice([Yes, No])
+        action = self.rng.choice([Yes, No])
         response = yield action
         p_valid = self._valid_detector.action_valid(action, first_sentence(response))
         success = (p_valid > 0.5)
@@ -2,20 +2,22 @@ import os, sys, re
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from valid_detectors.learned_valid_detector import LearnedValidDetector
 from decision_module import DecisionModule
-from gv import dbg, rng
+from gv import component_dbg
 from action import StandaloneAction
 from event import NewTransitionEvent
 from util import first_sentence
 
+dbg = component_dbg('you_have_to')
+
 class YouHaveTo(DecisionModule):
     """
     The YouHaveTo module listens for phrases of the type You'll have to X first.
 
     """
-    def __init__(self, active=False):
-        super().__init__()
+    def __init__(self, ctx, active=False):
+        super().__init__(ctx)
         self._active = active
-        self._valid_detector = LearnedValidDetector()
+        self._valid_detector = LearnedValidDetector(ctx.kg)
         self.regexps = [
             re.compile(".*(Perhaps you should|You should|You'll have to|You'd better|You\'re not going anywhere until you) (.*) first.*"),
             re.compile(".*(You\'re not going anywhere until you) (.*)\..*"),
@@ -40,7 +42,7 @@ class YouHaveTo(DecisionModule):
             match = self.match(event.new_obs)
             if match:
                 self.act_to_do = StandaloneAction(match)
-                if self.act_to_do.recognized():
+                if self.act_to_do.recognized(self.kg):
                     self._eagerness = 1.
 
 
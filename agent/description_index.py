@@ -0,0 +1,142 @@
+import zlib
+import numpy as np
+from fuzzywuzzy import fuzz
+
+
+class DescriptionIndex:
+    """
+    Similarity index over the descriptions of locations or entities.
+
+    Each description is stored as a normalized vector of hashed character
+    n-gram counts, so that one matrix product scores a query against every
+    indexed description. Exact and near-duplicate matches are decided from
+    these scores alone; only the few best candidates of an ambiguous query
+    are re-scored with fuzz.partial_ratio.
+
+    @args
+    dim: Number of hash buckets used for the n-gram vectors
+    ngram: Length of the character n-grams
+    accept_similarity: Cosine similarity above which a match is accepted
+                       without fuzzy re-scoring
+    num_rescored: Number of best candidates re-scored with partial_ratio
+
+    """
+    __slots__ = ('_dim', '_ngram', '_accept_similarity', '_num_rescored',
+                 '_items', '_texts', '_rows', '_exact', '_vectors')
+
+    def __init__(self, dim=1024, ngram=3, accept_similarity=.9, num_rescored=4):
+        self._dim               = dim
+        self._ngram             = ngram
+        self._accept_similarity = accept_similarity
+        self._num_rescored      = num_rescored
+        self._items             = [] # Row : item
+        self._texts             = [] # Row : description
+        self._rows              = {} # id(item) : row
+        self._exact             = {} # description : [items]
+        self._vectors           = None # Allocated on first add
+
+    def __getstate__(self):
+        return dict((slot, getattr(self, slot)) for slot in self.__slots__ if slot != '_rows')
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        # Rows are keyed by id, which changes when unpickled.
+        self._rows = dict((id(item), row) for row, item in enumerate(self._items))
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return id(item) in self._rows
+
+    def vectorize(self, text):
+        """ Returns the normalized n-gram vector of a text. """
+        vector = np.zeros(self._dim, dtype=np.float32)
+        text = ' '.join(text.lower().split())
+        if not text:
+            return vector
+        padded = ' ' + text + ' '
+        n = self._ngram
+        buckets = [zlib.crc32(padded[i:i+n].encode('utf-8')) % self._dim
+                   for i in range(max(1, len(padded) - n + 1))]
+        np.add.at(vector, buckets, 1.)
+        return vector / np.linalg.norm(vector)
+
+    def add(self, item, text):
+        """ Indexes item under the given description, replacing any previous one. """
+        if item in self:
+            self.remove(item)
+        if not text:
+            return
+        row = len(self._items)
+        if self._vectors is None or row == self._vectors.shape[0]:
+            grown = np.zeros((max(4, 2 * row), self._dim), dtype=np.float32)
+            if row:
+                grown[:row] = self._vectors
+            self._vectors = grown
+        self._vectors[row] = self.vectorize(text)
+        self._items.append(item)
+        self._texts.append(text)
+        self._rows[id(item)] = row
+        self._exact.setdefault(text, []).append(item)
+
+    def remove(self, item):
+        """ Removes an item from the index if present. """
+        row = self._rows.pop(id(item), None)
+        if row is None:
+            return
+        text = self._texts[row]
+        self._exact[text].remove(item)
+        if not self._exact[text]:
+            del self._exact[text]
+        last = len(self._items) - 1
+        if row != last:
+            # Move the last row into the freed slot.
+            self._items[row] = self._items[last]
+            self._texts[row] = self._texts[last]
+            self._vectors[row] = self._vectors[last]
+            self._rows[id(self._items[row])] = row
+        self._items.pop()
+        self._texts.pop()
+
+    def best_match(self, text, candidates=None, accept_similarity=None):
+        """
+        Returns (item, confidence) for the indexed description most similar
+        to text, or (None, 0.) if nothing matches. Confidence is in [0,1].
+        If candidates is given, only those items are considered.
+
+        """
+        if accept_similarity is None:
+            accept_similarity = self._accept_similarity
+        if candidates is not None:
+            candidate_ids = set(id(c) for c in candidates)
+            rows = [self._rows[i] for i in candidate_ids if i in self._rows]
+            rows.sort()
+        else:
+            candidate_ids = None
+            rows = range(len(self._items))
+        if not len(rows):
+            return None, 0.
+        for item in self._exact.get(text, []):
+            if candidate_ids is None or id(item) in candidate_ids:
+                return item, 1.
+        rows = np.fromiter(rows, dtype=np.int64, count=len(rows))
+        similarities = self._vectors[rows] @ self.vectorize(text)
+        best = int(np.argmax(similarities))
+        if similarities[best] >= accept_similarity:
+            return self._items[rows[best]], float(similarities[best])
+        # Ambiguous: re-score the most similar descriptions.
+        if len(rows) > self._num_rescored:
+            top = np.argpartition(-similarities, self._num_rescored)[:self._num_rescored]
+            top = sorted(top, key=lambda i: (-similarities[i], i))
+        else:
+            top = range(len(rows))
+        most_similar = None
+        best_similarity = 0
+        for i in top:
+            similarity = fuzz.partial_ratio(self._texts[rows[i]], text)
+            if similarity > best_similarity:
+                best_similarity = similarity
+                most_similar = self._items[rows[i]]
+        return most_similar, best_similarity / 100.
@@ -1,5 +1,6 @@
+import sys, itertools
 import event
-import gv
+import context
 import util
 
 
@@ -12,15 +13,26 @@ class Entity:
     location: Location in which the entity was first encountered
     description: A long form description of the entity
 
+    Changes are reported to the active AgentContext (see context.py).
+
     """
+    __slots__ = ('_names', '_description', '_action_records', '_entities',
+                 '_state', '_attributes', '_init_loc', '_containers')
+
+    # Advanced whenever any entity's display name changes, so that
+    # actions know when to recompute their text.
+    name_version = 0
+    _name_versions = itertools.count(1)
+
     def __init__(self, name, location, description=''):
-        self._names       = [name] # List of names for the entity
-        self._description = description
+        self._names       = [sys.intern(name)] # List of names for the entity
+        self._description = context.active().text_pool.get(description)
         self._action_records = {} # verb : (p_valid, result_text)
         self._entities    = []
         self._state       = EntityState()
         self._attributes  = []
         self._init_loc    = location
+        self._containers  = [] # Locations currently holding this entity
 
     @property
     def name(self):
@@ -28,7 +40,17 @@ class Entity:
 
     @name.setter
     def name(self, value):
+        old_name = self._names[0]
+        value = sys.intern(value)
         self._names[0] = value
+        Entity.name_version = next(Entity._name_versions)
+        for container in self._containers:
+            if old_name not in self._names:
+                container._unindex_name(old_name, self)
+            container._index_name(value, self)
+        recorder = context.active().kg_recorder
+        if recorder:
+            recorder.entity_renamed(self, value)
 
     @property
     def names(self):
@@ -40,10 +62,17 @@ class Entity:
     def add_name(self, new_name):
         if new_name in self.names:
             return
+        new_name = sys.intern(new_name)
         if len(new_name.split(' ')) < len(self.name.split(' ')):
             self._names.insert(0, new_name)
+            Entity.name_version = next(Entity._name_versions)
         else:
             self._names.append(new_name)
+        for container in self._containers:
+            container._index_name(new_name, self)
+        recorder = context.active().kg_recorder
+        if recorder:
+            recorder.name_added(self, new_name)
 
     @property
     def description(self):
@@ -51,7 +80,12 @@ class Entity:
 
     @description.setter
     def description(self, value):
-        self._description = value
+        ctx = context.active()
+        self._description = ctx.text_pool.get(value)
+        for container in self._containers:
+            container._index_description(self)
+        if ctx.kg_recorder:
+            ctx.kg_recorder.description_changed(self)
 
     @property
     def action_records(self):
@@ -63,15 +97,21 @@ class Entity:
         resulting game text.
 
         """
+        ctx = context.active()
+        result_text = ctx.text_pool.get(result_text)
+        if p_valid > .5:
+            ctx.kg.journal_action_record(self, action)
         if action not in self._action_records and p_valid > .5:
-            gv.event_stream.push(event.NewActionRecordEvent(self, action, result_text))
+            ctx.event_stream.push(event.NewActionRecordEvent(self, action, result_text))
         self._action_records[action] = (p_valid, result_text)
+        if ctx.kg_recorder:
+            ctx.kg_recorder.action_recorded(self, action, p_valid, result_text)
 
     def has_action_record(self, action):
         return action in self._action_records
 
     def add_entity(self, entity):
-        gv.event_stream.push(event.NewEntityEvent(entity))
+        context.active().event_stream.push(event.NewEntityEvent(entity))
         self._entities.append(entity)
 
     def del_entity(self, entity):
@@ -83,23 +123,17 @@ class Entity:
 
     def add_attribute(self, attribute):
         if attribute not in self._attributes:
-            gv.event_stream.push(event.NewAttributeEvent(self, attribute))
+            ctx = context.active()
+            ctx.event_stream.push(event.NewAttributeEvent(self, attribute))
+            ctx.kg.index_attribute(self, attribute)
             self._attributes.append(attribute)
+            if ctx.kg_recorder:
+                ctx.kg_recorder.attribute_added(self, attribute)
 
     @property
     def state(self):
         return self._state
 
-    def reset(self):
-        """ Reset the entity to a state similar to when the game started. """
-        # Remove all successful action records
-        to_remove = []
-        for action_record, (p_valid, result_text) in self.action_records.items():
-            if p_valid > .5:
-                to_remove.append(action_record)
-        for action_record in to_remove:
-            del self.action_records[action_record]
-
     def to_string(self, prefix=''):
         s = prefix + "Entity: {}".format(self.name)
         if self._action_records:
@@ -127,38 +161,45 @@ class EntityState:
     Keeps track of the current state of the entity.
 
     """
+    __slots__ = ('exists', 'is_open', 'is_locked', 'is_on')
+
     def __init__(self):
         self.exists = True
 
+    def _set(self, field, value):
+        """ Changes a state field, journaling the old value for resets. """
+        context.active().kg.journal_state(self, field)
+        setattr(self, field, value)
+
     def openable(self):
         return has_attr(self, 'is_open')
 
     def open(self):
-        self.is_open = True
+        self._set('is_open', True)
 
     def close(self):
-        self.is_open = False
+        self._set('is_open', False)
 
     def lockable(self):
         return has_attr(self, 'is_locked')
 
     def lock(self):
-        self.is_locked = True
+        self._set('is_locked', True)
 
     def unlock(self):
-        self.is_locked = False
+        self._set('is_locked', False)
 
     def switchable(self):
         return has_attr(self, 'is_on')
 
     def turn_on(self):
-        self.is_on = True
+        self._set('is_on', True)
 
     def turn_off(self):
-        self.is_on = False
+        self._set('is_on', False)
 
     def remove(self):
-        self.exists = False
+        self._set('exists', False)
 
     def __str__(self):
         pass
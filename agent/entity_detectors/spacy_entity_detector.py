@@ -1,7 +1,7 @@
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from entity_detector import EntityDetector
-import gv
+import util
 
 
 class SpacyEntityDetector(EntityDetector):
@@ -13,10 +13,8 @@ class SpacyEntityDetector(EntityDetector):
 
 
     def detect(self, observation_text):
-        doc = gv.nlp(observation_text)
         nouns = []
-        for chunk in doc.noun_chunks:
-            noun = chunk.root.text.lower()
+        for noun in util.parse(observation_text).noun_roots:
             if noun in self.disallowed:
                 continue
             if noun not in nouns:
@@ -1,37 +1,61 @@
+import threading
 import gv
 import util
 
+_dbg = gv.component_dbg('events')
+
 class EventStream:
     """
-    An event stream keeps track of incoming events.
+    An event stream keeps track of incoming events. Events are pushed and
+    cleared by the agent thread, but may be read from any thread.
 
     """
     def __init__(self):
         self._stream = []
+        self._lock   = threading.Lock()
 
     def push(self, event):
-        gv.dbg("[LOG]({}) {}".format(type(event).__name__, event.message))
-        self._stream.append(event)
+        _dbg("[LOG]({}) {}".format(type(event).__name__, event.message))
+        with self._lock:
+            self._stream.append(event)
 
     def clear(self):
-        del self._stream[:]
+        with self._lock:
+            self._stream = []
+
+    def __getstate__(self):
+        with self._lock:
+            return {'_stream': list(self._stream)}
+
+    def __setstate__(self, state):
+        self._stream = state['_stream']
+        self._lock   = threading.Lock()
 
     def read(self):
         """ Iterate through the events in the stream. """
-        for event in self._stream:
-            yield event
+        with self._lock:
+            stream = self._stream
+            num_events = len(stream)
+        for i in range(num_events):
+            yield stream[i]
 
 
 class Event:
     """ Base class for all events. """
+    __slots__ = ('message',)
+
     def __init__(self, message):
         self.message = message
 
 class NewTransitionEvent(Event):
     """ Generated whenever an action is taken. """
+    __slots__ = ('obs', 'action', 'score', 'new_obs', 'terminal')
+
     def __init__(self, obs, action, score, new_obs, terminal):
         message = '\"{}\" --> {} Score={}'.format(action, util.clean(new_obs), score)
         super().__init__(message)
+        # Not pooled: the event is dropped at the end of the step, and
+        # pooling every observation would grow the pool without bound.
         self.obs      = obs
         self.action   = action
         self.score    = score
@@ -40,12 +64,16 @@ class NewTransitionEvent(Event):
 
 class NewLocationEvent(Event):
     """ Generated whenever a new location is discovered. """
+    __slots__ = ('new_location',)
+
     def __init__(self, new_location):
         super().__init__(new_location.name)
         self.new_location = new_location
 
 class NewEntityEvent(Event):
     """ Generated whenever a new entity is discovered. """
+    __slots__ = ('new_entity',)
+
     def __init__(self, new_entity):
         message = "{}: {}".format(new_entity.name, new_entity.description)
         super().__init__(message)
@@ -53,6 +81,8 @@ class NewEntityEvent(Event):
 
 class NewActionRecordEvent(Event):
     """ Generated whenever a new action is applied. """
+    __slots__ = ('entity', 'action_record', 'result_text')
+
     def __init__(self, entity, action_record, result_text):
         message = "{} ==({})==> {}".format(entity, action_record, util.clean(result_text))
         super().__init__(message)
@@ -62,6 +92,8 @@ class NewActionRecordEvent(Event):
 
 class NewConnectionEvent(Event):
     """ Generated whenever a new connection is discovered. """
+    __slots__ = ('connection',)
+
     def __init__(self, connection):
         message = "{} ==({})==> {}".format(connection.from_location, connection.action, connection.to_location)
         super().__init__(message)
@@ -69,12 +101,16 @@ class NewConnectionEvent(Event):
 
 class LocationChangedEvent(Event):
     """ Generated whenever the player's location changes. """
+    __slots__ = ('new_location',)
+
     def __init__(self, new_location):
         super().__init__(new_location.name)
         self.new_location = new_location
 
 class EntityMovedEvent(Event):
     """ Generated whenever an entity moves. """
+    __slots__ = ('entity', 'origin', 'destination')
+
     def __init__(self, entity, origin, destination):
         super().__init__("EntityMoved")
         self.entity = entity
@@ -83,6 +119,8 @@ class EntityMovedEvent(Event):
 
 class NewAttributeEvent(Event):
     """ Generated whenever an object is given an attribute. """
+    __slots__ = ('new_attribute',)
+
     def __init__(self, entity, new_attribute):
         message = "{} is {}".format(entity.name, new_attribute.name)
         super().__init__(message)
@@ -1,30 +1,31 @@
 import os, sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-import event
-import knowledge_graph
-import random
-import action
-import attribute
 import logging
-import spacy
-
-# Global RNG
-rng = random.Random()
 
-# Global logger
+# Global logger. Each component logs to its own child logger, nail.<component>,
+# so that its level can be set separately (see agent_log.set_levels).
 logger = logging.getLogger('nail')
 logger.setLevel(logging.DEBUG)
 dbg = logger.debug
 
-# Global Event Stream
-event_stream = event.EventStream()
+def component_dbg(component):
+    """ Returns the debug function of a component's logger. """
+    return logger.getChild(component).debug
+
+# Imported after component_dbg is defined, as they call it when gv imports them.
+import event
+import action
+import attribute
+import util
+import spacy
+
+# The knowledge graph, event stream, rng and text pool of each agent live in
+# its AgentContext (see context.py). Everything here is shared read-only by
+# all agents in the process.
 
 # Actions that are dissallowed in any game
 ILLEGAL_ACTIONS = ['restart', 'verbose', 'save', 'restore', 'score', 'quit', 'moves']
 
-# Global Knowledge Graph
-kg = knowledge_graph.KnowledgeGraph()
-
 # Spacy NLP instance
 try:
     nlp = spacy.load('en')
@@ -51,6 +52,8 @@ Exit       = action.NavAction('exit')
 Climb      = action.NavAction('climb')
 In         = action.NavAction('in')
 Out        = action.NavAction('out')
+NavActions = [North, South, West, East, NorthWest, SouthWest, NorthEast,
+              SouthEast, Up, Down, Enter, Exit]
 GetUp      = action.StandaloneAction('get up')
 TakeAll    = action.StandaloneAction('take all')
 Yes        = action.StandaloneAction('yes')
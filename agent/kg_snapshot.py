@@ -0,0 +1,353 @@
+import os, sys, json, queue, threading
+from contextlib import contextmanager
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import gv
+import action as action_module
+from attribute import Attribute
+from context import AgentContext
+from entity import Entity, EntityState
+from event import EventStream
+from knowledge_graph import Connection
+from location import Location
+
+
+# Version of the saved knowledge graph format written by save_knowledge_graph.
+# Version 2 adds entity state and entities held by entities; version 1 files
+# can still be loaded.
+FORMAT_VERSION = 2
+
+
+class KnowledgeGraphSerializer:
+    """
+    Converts knowledge graph objects into compact, JSON-serializable change
+    records. Locations and entities are described once, when first seen, and
+    are referred to by integer ids afterwards. The inventory always has id 0.
+
+    """
+    def __init__(self, kg):
+        self._kg      = kg
+        self._ids     = {kg.inventory: 0} # Location or Entity : id
+        self._changes = []
+
+    def _ref(self, obj):
+        """ Returns the id of a location or entity, recording it if new. """
+        ref = self._ids.get(obj)
+        if ref is not None:
+            return ref
+        ref = len(self._ids)
+        self._ids[obj] = ref
+        if isinstance(obj, Location):
+            self._changes.append(('loc', ref, obj.description))
+        else:
+            init_loc = self._ref(obj._init_loc) if obj._init_loc is not None else None
+            self._changes.append(('ent', ref, list(obj.names), obj.description, init_loc))
+        return ref
+
+    def _action(self, act):
+        """ Returns a serializable description of an action. """
+        cls = type(act).__name__
+        if isinstance(act, action_module.SingleAction):
+            return (cls, act.verb, self._ref(act.entity))
+        if isinstance(act, action_module.DoubleAction):
+            return (cls, act.verb, self._ref(act.entity1), act.prep, self._ref(act.entity2))
+        if isinstance(act, action_module.ExamineAction):
+            return (cls, act.verb, act.entity_name)
+        return (cls, act.verb)
+
+    def _connection(self, connection):
+        to_loc = connection.to_location
+        return ('con', self._ref(connection.from_location),
+                self._action(connection.action),
+                self._ref(to_loc) if to_loc is not None else None,
+                connection.message)
+
+    def dump(self):
+        """ Returns the changes that rebuild the whole knowledge graph. """
+        kg = self._kg
+        for location in kg.locations:
+            self._ref(location)
+        for location in (kg._init_loc, kg.player_location):
+            if location is not None:
+                self._changes.append(('player', self._ref(location)))
+        dumped = set() # Entities held by several containers are described once
+        for container in [kg.inventory] + kg.locations:
+            for entity in container.entities:
+                self._dump_entity(container, entity, dumped)
+            for act, (p_valid, result_text) in container.action_records.items():
+                self._changes.append(('rec', self._ref(container), self._action(act),
+                                      p_valid, result_text))
+        for location in kg.locations:
+            for connection in kg.connections.outgoing(location):
+                self._changes.append(self._connection(connection))
+        for word in sorted(kg._unrecognized_words - set(gv.ILLEGAL_ACTIONS)):
+            self._changes.append(('unrec', word))
+        changes, self._changes = self._changes, []
+        return changes
+
+    def _dump_entity(self, container, entity, dumped):
+        """ Adds the changes that rebuild entity in container, and the entities it holds. """
+        self._changes.append(('add', self._ref(container), self._ref(entity)))
+        if entity in dumped:
+            return
+        dumped.add(entity)
+        for attribute in entity._attributes:
+            self._changes.append(('attr', self._ref(entity), attribute.name))
+        for field in EntityState.__slots__:
+            if hasattr(entity.state, field):
+                self._changes.append(('state', self._ref(entity), field,
+                                      getattr(entity.state, field)))
+        for act, (p_valid, result_text) in entity.action_records.items():
+            self._changes.append(('rec', self._ref(entity), self._action(act),
+                                  p_valid, result_text))
+        for held in entity._entities:
+            self._dump_entity(entity, held, dumped)
+
+
+
+class KnowledgeGraphRecorder(KnowledgeGraphSerializer):
+    """
+    Records changes to the knowledge graph as compact delta records and
+    writes one JSON line per snapshot on a background thread.
+
+    Knowledge graph objects report their changes to the recorder while it
+    is installed as the kg_recorder of their AgentContext. Each line has the form
+    {"step": n, "changes": [[op, args...], ...]} and holds only what changed
+    since the previous snapshot. load_snapshot replays the lines to rebuild
+    the graph at any step.
+
+    """
+    def __init__(self, kg, path):
+        super().__init__(kg)
+        self._paused  = False
+        self._queue   = queue.Queue()
+        self._file    = open(path, 'w')
+        self._writer  = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _record(self, *change):
+        if not self._paused:
+            self._changes.append(change)
+
+    @contextmanager
+    def paused(self):
+        """ Suspends recording, e.g. while a recorded operation is replayed. """
+        self._paused = True
+        try:
+            yield
+        finally:
+            self._paused = False
+
+    def location_added(self, location):
+        if not self._paused:
+            self._ref(location)
+
+    def player_moved(self, location):
+        if not self._paused:
+            self._record('player', self._ref(location))
+
+    def entity_added(self, container, entity):
+        if not self._paused:
+            self._record('add', self._ref(container), self._ref(entity))
+
+    def entity_removed(self, container, entity):
+        if not self._paused:
+            self._record('del', self._ref(container), self._ref(entity))
+
+    def entity_renamed(self, entity, name):
+        if not self._paused:
+            self._record('rename', self._ref(entity), name)
+
+    def name_added(self, entity, name):
+        if not self._paused:
+            self._record('alias', self._ref(entity), name)
+
+    def description_changed(self, entity):
+        if not self._paused:
+            self._record('desc', self._ref(entity), entity.description)
+
+    def attribute_added(self, entity, attribute):
+        if not self._paused:
+            self._record('attr', self._ref(entity), attribute.name)
+
+    def action_recorded(self, owner, act, p_valid, result_text):
+        if not self._paused:
+            self._record('rec', self._ref(owner), self._action(act), p_valid, result_text)
+
+    def connection_added(self, connection):
+        if not self._paused:
+            self._record(*self._connection(connection))
+
+    def word_unrecognized(self, word):
+        self._record('unrec', word)
+
+    def graph_reset(self):
+        self._record('reset')
+
+    def record_graph(self):
+        """ Records the whole graph as it is now, e.g. after it was loaded. """
+        self._changes = self.dump()
+
+    def snapshot(self, step):
+        """ Hands the changes since the last snapshot to the writer thread. """
+        if self._changes:
+            self._queue.put((step, self._changes))
+            self._changes = []
+
+    def close(self):
+        """ Waits for pending snapshots to be written and closes the file. """
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            step, changes = item
+            self._file.write(json.dumps({'step': step, 'changes': changes},
+                                        separators=(',', ':')) + '\n')
+            if self._queue.empty():
+                self._file.flush()
+
+
+
+def _make_action(spec, objects):
+    """ Rebuilds an action from its serialized description. """
+    cls = getattr(action_module, spec[0])
+    act = cls.__new__(cls)
+    action_module.Action.__init__(act, spec[1])
+    if issubclass(cls, action_module.SingleAction):
+        act.entity = objects[spec[2]]
+    elif issubclass(cls, action_module.DoubleAction):
+        act.entity1 = objects[spec[2]]
+        act.prep = spec[3]
+        act.entity2 = objects[spec[4]]
+    elif issubclass(cls, action_module.ExamineAction):
+        act.entity_name = spec[2]
+    return act
+
+
+def save_knowledge_graph(kg, path, rom_name):
+    """ Saves the whole knowledge graph for warm-starting later runs on rom_name. """
+    changes = KnowledgeGraphSerializer(kg).dump()
+    with open(path, 'w') as f:
+        f.write(json.dumps({'format': 'nail_kg', 'version': FORMAT_VERSION,
+                            'rom': rom_name}) + '\n')
+        f.write(json.dumps({'step': 0, 'changes': changes}, separators=(',', ':')) + '\n')
+
+
+def load_knowledge_graph(path, rom_name=None, kg=None):
+    """
+    Loads a knowledge graph saved by save_knowledge_graph. The graph is
+    rebuilt into kg if given, otherwise into the graph of a new AgentContext,
+    which is returned. Raises ValueError if the file was saved by an incompatible
+    version or, when rom_name is given, for a different game.
+
+    The loaded graph is what the next episode starts from: entities that
+    had moved are returned to where they were first encountered, and the
+    loaded action records and states are not undone by resets. The
+    discovery events of the loaded locations and entities are left in the
+    context's event stream, for the decision modules to learn the world
+    from as if it had just been explored.
+
+    """
+    with open(path) as f:
+        header = json.loads(f.readline())
+    if header.get('format') != 'nail_kg' or header.get('version') not in (1, FORMAT_VERSION):
+        raise ValueError("{} is not a version {} knowledge graph".format(path, FORMAT_VERSION))
+    if rom_name is not None and header['rom'] != rom_name:
+        raise ValueError("{} was saved for {}, not {}".format(path, header['rom'], rom_name))
+    if kg is None:
+        kg = AgentContext().kg
+    with kg.unjournaled():
+        objects = _replay_file(kg, path, events=True)
+        with kg.ctx.activate():
+            kg.return_entities([obj for obj in objects.values() if isinstance(obj, Entity)])
+    return kg
+
+
+def load_snapshot(path, step=None):
+    """
+    Rebuilds the knowledge graph recorded in path as it was after the given
+    step, or after the last recorded step if step is None. Returns the graph
+    of a new AgentContext; the agent's own graph is not touched.
+
+    """
+    kg = AgentContext().kg
+    _replay_file(kg, path, step)
+    return kg
+
+
+def _replay_file(kg, path, step=None, events=False):
+    """
+    Replays the change records in path into kg, with kg's context active,
+    and returns the replayed locations and entities by id. The changes are
+    not recorded. Events raised while replaying go to the context's event
+    stream if events is set, otherwise to a scratch stream.
+
+    """
+    attributes = dict((a.name, a) for a in vars(gv).values() if isinstance(a, Attribute))
+    ctx = kg.ctx
+    live_stream, live_recorder = ctx.event_stream, ctx.kg_recorder
+    ctx.event_stream, ctx.kg_recorder = live_stream if events else EventStream(), None
+    try:
+        objects = {0: kg.inventory}
+        with ctx.activate(), open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                if 'step' not in record:
+                    continue # Header
+                if step is not None and record['step'] > step:
+                    break
+                for change in record['changes']:
+                    _replay(kg, objects, attributes, change)
+    finally:
+        ctx.event_stream, ctx.kg_recorder = live_stream, live_recorder
+    return objects
+
+
+def _replay(kg, objects, attributes, change):
+    """ Applies a single recorded change to kg. """
+    op = change[0]
+    if op == 'loc':
+        location = Location(change[2])
+        objects[change[1]] = location
+        kg.add_location(location)
+    elif op == 'ent':
+        names = change[2]
+        init_loc = objects[change[4]] if change[4] is not None else None
+        entity = Entity(names[0], init_loc, description=change[3])
+        for name in names[1:]:
+            entity._names.append(name)
+        objects[change[1]] = entity
+    elif op == 'player':
+        kg.player_location = objects[change[1]]
+        if kg._init_loc is None:
+            kg._init_loc = kg.player_location
+    elif op == 'add':
+        objects[change[1]].add_entity(objects[change[2]])
+    elif op == 'del':
+        objects[change[1]].del_entity(objects[change[2]])
+    elif op == 'rename':
+        objects[change[1]].name = change[2]
+    elif op == 'alias':
+        objects[change[1]].add_name(change[2])
+    elif op == 'desc':
+        objects[change[1]].description = change[2]
+    elif op == 'attr':
+        objects[change[1]].add_attribute(attributes[change[2]])
+    elif op == 'state':
+        setattr(objects[change[1]].state, change[2], change[3])
+    elif op == 'rec':
+        objects[change[1]].add_action_record(_make_action(change[2], objects), change[3], change[4])
+    elif op == 'con':
+        to_loc = objects[change[3]] if change[3] is not None else None
+        kg.add_connection(Connection(objects[change[1]], _make_action(change[2], objects),
+                                     to_loc, change[4]))
+    elif op == 'unrec':
+        kg.add_unrecognized_word(change[1])
+    elif op == 'reset':
+        kg.reset()
+    else:
+        raise ValueError("Unknown snapshot change {}".format(op))
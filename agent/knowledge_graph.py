@@ -1,25 +1,57 @@
-import os, sys
+import os, sys, itertools
+from contextlib import contextmanager
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from event import *
 from entity import *
 from location import Location, Inventory
 import gv
-from util import clean
-from fuzzywuzzy import fuzz
+from util import clean, ReadWriteLock
 from action import Action
+from description_index import DescriptionIndex
+import context
+
+_dbg = gv.component_dbg('kg')
+
+# Journaled value of an EntityState field that was never set.
+_UNSET = object()
+
 
 class KnowledgeGraph:
     """
-    Knowledge Representation consists of visisted locations.
+    Knowledge Representation consists of visisted locations. Each graph
+    belongs to an AgentContext, whose event stream and recorder receive its
+    changes.
+
+    The graph is only modified by the agent thread, which holds lock for
+    writing while it does so. Other threads must hold lock for reading:
+
+        with kg.lock.read():
+            ...
 
     """
-    def __init__(self):
+    # Source of unrecognized_version values. Each graph takes a fresh value
+    # whenever a word becomes unrecognized, so that actions, which may be
+    # shared by several graphs, know when their cached recognized() is stale.
+    _unrecognized_versions = itertools.count(1)
+
+    def __init__(self, ctx):
+        self.ctx                 = ctx
+        self.lock                = ReadWriteLock()
         self._locations          = []
+        self._locations_by_name  = {} # name : [locations]
+        self._location_index     = DescriptionIndex()
         self._player_location    = None
         self._init_loc           = None
         self._inventory          = Inventory()
-        self._connections        = ConnectionGraph()
-        self._unrecognized_words = gv.ILLEGAL_ACTIONS[:]
+        self._connections        = ConnectionGraph(ctx)
+        self._unrecognized_words = set(gv.ILLEGAL_ACTIONS)
+        self.unrecognized_version = next(KnowledgeGraph._unrecognized_versions)
+        self._untried_nav        = {} # Location : {nav actions not yet tried : None}
+        self._unexplored         = {} # Locations with nav actions not yet tried : None
+        self._entities_by_attr   = {} # Attribute : {entities : None}
+        self._moved_entities     = {} # Entities moved this episode : None
+        self._journal            = [] # Undo records of state changes this episode
+        self._journaling         = True
 
     @property
     def locations(self):
@@ -28,26 +60,87 @@ class KnowledgeGraph:
     def add_location(self, new_location):
         """ Adds a new location object and broadcasts a NewLocation event. """
         self._locations.append(new_location)
-        gv.event_stream.push(NewLocationEvent(new_location))
-
-    def most_similar_location(self, description):
-        """ Returns the location with the highest similarity to the given description. """
-        possible_name = Location.extract_name(description)
-        existing_locs = self.locations_with_name(possible_name)
-        if not existing_locs:
-            existing_locs = self._locations
-        most_similar = None
-        best_similarity = 0
-        for loc in existing_locs:
-            similarity = fuzz.partial_ratio(loc.description, description)
-            if similarity > best_similarity:
-                best_similarity = similarity
-                most_similar = loc
-        return most_similar
+        self._locations_by_name.setdefault(new_location.name, []).append(new_location)
+        self._location_index.add(new_location, new_location.description)
+        untried = dict((act, None) for act in gv.NavActions
+                       if act not in new_location.action_records)
+        self._untried_nav[new_location] = untried
+        if untried:
+            self._unexplored[new_location] = None
+        if self.ctx.kg_recorder:
+            self.ctx.kg_recorder.location_added(new_location)
+        self.ctx.event_stream.push(NewLocationEvent(new_location))
+
+    def most_similar_location(self, description, candidates=None):
+        """
+        Returns the location with the highest similarity to the given
+        description. Considers the locations sharing the description's name
+        unless an explicit list of candidates is given.
+
+        """
+        return self.match_location(description, candidates)[0]
+
+    def match_location(self, description, candidates=None):
+        """ Returns (location, confidence) for the best match to the description. """
+        if candidates is None:
+            possible_name = Location.extract_name(description)
+            candidates = self.locations_with_name(possible_name) or None
+        return self._location_index.best_match(description, candidates)
 
     def locations_with_name(self, location_name):
         """ Returns all locations with a particular name. """
-        return [l for l in self._locations if l.name == location_name]
+        return self._locations_by_name.get(location_name, [])
+
+    def unexplored_locations(self):
+        """ Returns the locations that have recognized nav actions left to try. """
+        return [loc for loc in self._unexplored
+                if any(act.recognized(self) for act in self._untried_nav[loc])]
+
+    def untried_nav_actions(self, location):
+        """ Returns the recognized nav actions not yet attempted from location. """
+        untried = self._untried_nav.get(location)
+        if untried is None: # Not added through add_location
+            return [act for act in gv.NavActions
+                    if act not in location.action_records and act.recognized(self)]
+        return [act for act in untried if act.recognized(self)]
+
+    def descriptionless_entities(self, location):
+        """ Returns the entities at location that have not been described. """
+        return location.descriptionless_entities
+
+    def entities_with_attribute(self, attribute):
+        """ Returns the entities known to have the given attribute. """
+        return list(self._entities_by_attr.get(attribute, ()))
+
+    def index_action_record(self, location, action):
+        """ Updates the query indexes for an action recorded at location. """
+        untried = self._untried_nav.get(location)
+        if untried and action in untried:
+            del untried[action]
+            if not untried:
+                del self._unexplored[location]
+
+    def index_attribute(self, entity, attribute):
+        """ Updates the query indexes for a new attribute of entity. """
+        self._entities_by_attr.setdefault(attribute, {})[entity] = None
+
+    def add_unrecognized_word(self, word):
+        """ Records a word the game doesn't recognize. Returns True if it is new. """
+        if word in self._unrecognized_words:
+            return False
+        self._unrecognized_words.add(word)
+        self.unrecognized_version = next(KnowledgeGraph._unrecognized_versions)
+        if self.ctx.kg_recorder:
+            self.ctx.kg_recorder.word_unrecognized(word)
+        return True
+
+    def is_recognized(self, word):
+        return word not in self._unrecognized_words
+
+    @property
+    def unrecognized_words(self):
+        """ Words found to be unrecognized, besides gv.ILLEGAL_ACTIONS. """
+        return self._unrecognized_words.difference(gv.ILLEGAL_ACTIONS)
 
     @property
     def player_location(self):
@@ -58,8 +151,10 @@ class KnowledgeGraph:
         """ Changes player location and broadcasts a LocationChangedEvent. """
         if new_location == self._player_location:
             return
-        gv.event_stream.push(LocationChangedEvent(new_location))
+        self.ctx.event_stream.push(LocationChangedEvent(new_location))
         self._player_location = new_location
+        if self.ctx.kg_recorder:
+            self.ctx.kg_recorder.player_moved(new_location)
 
     @property
     def inventory(self):
@@ -70,16 +165,86 @@ class KnowledgeGraph:
         return self._connections
 
     def add_connection(self, new_connection):
-        """ Adds a connection object. """
-        self._connections.add(new_connection)
+        """ Adds a connection object. Returns True if it was new. """
+        return self._connections.add(new_connection)
 
     def reset(self):
         """Returns the knowledge_graph to a state resembling the start of the
         game. Note this does not remove discovered objects or locations. """
+        recorder = self.ctx.kg_recorder
+        if recorder:
+            # Replaying the reset reproduces its changes, so only the reset is recorded.
+            recorder.graph_reset()
+            with recorder.paused():
+                self._reset()
+        else:
+            self._reset()
+
+    def _reset(self):
+        """
+        Undoes the journaled changes of the episode: the successful entity
+        action records made in it are removed, as are any failed records they
+        replaced, so the actions can be retried. Records kept from before the
+        episode, e.g. loaded ones, are restored. Entity state changes are
+        reverted, and every entity that moved is returned to the location
+        where it was first encountered.
+
+        """
         self.player_location = self._init_loc
-        self.inventory.reset()
-        for location in self.locations:
-            location.reset()
+        journal, self._journal = self._journal, []
+        moved, self._moved_entities = self._moved_entities, {}
+        with self.unjournaled():
+            for change in reversed(journal):
+                if change[0] == 'record':
+                    _, entity, action, previous = change
+                    current = entity.action_records.get(action)
+                    if previous is not None and previous[0] > .5:
+                        entity.action_records[action] = previous
+                    elif current is not None and current[0] > .5:
+                        del entity.action_records[action]
+                else:
+                    _, state, field, previous = change
+                    if previous is _UNSET:
+                        delattr(state, field)
+                    else:
+                        setattr(state, field, previous)
+            self.return_entities(moved)
+
+    @contextmanager
+    def unjournaled(self):
+        """ Changes made in the with block are not undone by reset, e.g. while loading. """
+        journaling, self._journaling = self._journaling, False
+        try:
+            yield
+        finally:
+            self._journaling = journaling
+
+    def return_entities(self, entities):
+        """ Returns entities to the locations where they were first encountered. """
+        for entity in entities:
+            init_loc = entity._init_loc
+            if init_loc is None:
+                continue
+            for container in entity._containers[:]:
+                if container is init_loc:
+                    continue
+                init_loc.add_entity(entity)
+                container._remove_entity(entity)
+
+    def journal_move(self, entity):
+        """ Notes that entity moved, so that reset can return it. """
+        if self._journaling:
+            self._moved_entities[entity] = None
+
+    def journal_action_record(self, entity, action):
+        """ Journals an entity's action record before it is overwritten. """
+        if self._journaling:
+            self._journal.append(('record', entity, action, entity.action_records.get(action)))
+
+    def journal_state(self, state, field):
+        """ Journals the value of an EntityState field before it changes. """
+        if self._journaling:
+            self._journal.append(('state', state, field, getattr(state, field, _UNSET)))
 
     def __str__(self):
         s = "Knowledge Graph\n"
@@ -103,41 +268,48 @@ class KnowledgeGraph:
 
 class ConnectionGraph:
     """
-    Graph of connections between locations.
+    Graph of connections between locations. An action may lead to several
+    destinations from one location; navigate follows the first one found.
 
     """
-    def __init__(self):
-        self._out_graph = {} # Location : [Outgoing Connections]
-        self._in_graph  = {} # Location : [Incoming Connections]
+    def __init__(self, ctx):
+        self._ctx       = ctx
+        self._out_graph = {} # Location : {Outgoing Connection : None}
+        self._in_graph  = {} # Location : {Incoming Connection : None}
+        self._by_action = {} # Location : {action key : first Outgoing Connection}
 
     def add(self, connection):
-        """ Adds a new connection to the graph if it doesn't already exist. """
+        """
+        Adds a new connection to the graph if it doesn't already exist.
+        Returns True if the graph changed. An action leading somewhere new
+        from the same location adds a connection and keeps the old one.
+
+        """
         from_location = connection.from_location
         to_location = connection.to_location
-        gv.event_stream.push(NewConnectionEvent(connection))
-        if from_location in self._out_graph:
-            if connection in self._out_graph[from_location]:
-                return
-            self._out_graph[from_location].append(connection)
-        else:
-            self._out_graph[from_location] = [connection]
+        outgoing = self._out_graph.setdefault(from_location, {})
+        if connection in outgoing:
+            return False
+        outgoing[connection] = None
+        self._by_action.setdefault(from_location, {}).setdefault(connection.action.key, connection)
         if to_location is not None:
-            if to_location in self._in_graph:
-                self._in_graph[to_location].append(connection)
-            else:
-                self._in_graph[to_location] = [connection]
+            self._in_graph.setdefault(to_location, {})[connection] = None
+        self._ctx.event_stream.push(NewConnectionEvent(connection))
+        if self._ctx.kg_recorder:
+            self._ctx.kg_recorder.connection_added(connection)
+        return True
 
     def incoming(self, location):
-        """ Returns a list of incoming connections to the given location. """
+        """ Returns the incoming connections to the given location. """
         if location in self._in_graph:
-            return self._in_graph[location]
+            return self._in_graph[location].keys()
         else:
             return []
 
     def outgoing(self, location):
-        """ Returns a list of outgoing connections from the given location. """
+        """ Returns the outgoing connections from the given location. """
         if location in self._out_graph:
-            return self._out_graph[location]
+            return self._out_graph[location].keys()
         else:
             return []
 
@@ -147,13 +319,17 @@ class ConnectionGraph:
         """
         if not isinstance(nav_action, Action):
             raise ValueError("Expected Action. Got {}".format(type(nav_action)))
-        for connection in self.outgoing(location):
-            if connection.action == nav_action:
+        by_action = self._by_action.get(location)
+        if by_action:
+            connection = by_action.get(nav_action.key)
+            if connection is not None:
                 return connection.to_location
         return None
 
-    def shortest_path(self, start_location, end_location, path=[]):
+    def shortest_path(self, start_location, end_location, path=None):
         """ Find the shortest path between start and end locations. """
+        if path is None:
+            path = []
         if start_location == end_location:
             return path
         if start_location not in self._out_graph:
@@ -181,11 +357,13 @@ class Connection:
     message: The text response given by the game upon moving
 
     """
+    __slots__ = ('from_location', 'to_location', 'action', 'message')
+
     def __init__(self, from_location, action, to_location=None, message=''):
         self.from_location = from_location
         self.to_location   = to_location
         self.action        = action
-        self.message       = message
+        self.message       = context.active().text_pool.get(message)
 
     def __eq__(self, other):
         if isinstance(self, other.__class__):
@@ -206,4 +384,4 @@ class Connection:
         return str(self)
 
     def __hash__(self):
-        return hash(self.text())
+        return hash((self.action, id(self.from_location), id(self.to_location)))
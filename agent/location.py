@@ -1,18 +1,28 @@
-from fuzzywuzzy import fuzz
+import sys
 import gv
+import context
 from action import Action
+from description_index import DescriptionIndex
 from event import NewEntityEvent, NewActionRecordEvent
 
 class Location:
     """
     Each visited location contains information about entities, successful
-    interactions, and connections to other locations.
+    interactions, and connections to other locations. Changes are reported
+    to the active AgentContext (see context.py).
 
     """
+    __slots__ = ('_name', '_description', '_entities', '_entities_by_name',
+                 '_entity_index', '_descriptionless', '_action_records')
+
     def __init__(self, description=''):
-        self._name        = self.extract_name(description)
+        description = context.active().text_pool.get(description)
+        self._name        = sys.intern(self.extract_name(description))
         self._description = description
         self._entities    = []
+        self._entities_by_name = {} # name : [entities with that name]
+        self._entity_index = None # Created once an entity has a description
+        self._descriptionless = {} # Entities without a description : None
         self._action_records = {} # action : (p_valid, response)
 
     @property
@@ -25,7 +35,7 @@ class Location:
 
     @description.setter
     def description(self, value):
-        self._description = value
+        self._description = context.active().text_pool.get(value)
 
     @staticmethod
     def extract_name(description):
@@ -41,8 +51,56 @@ class Location:
 
     def add_entity(self, entity):
         if not self.has_entity_with_name(entity.name):
-            gv.event_stream.push(NewEntityEvent(entity))
+            ctx = context.active()
+            ctx.event_stream.push(NewEntityEvent(entity))
             self._entities.append(entity)
+            entity._containers.append(self)
+            for name in entity.names:
+                self._index_name(name, entity)
+            self._index_description(entity)
+            ctx.kg.journal_move(entity)
+            if ctx.kg_recorder:
+                ctx.kg_recorder.entity_added(self, entity)
+
+    def _remove_entity(self, entity):
+        """ Removes an entity and its names from this location. """
+        self._entities.remove(entity)
+        entity._containers.remove(self)
+        for name in entity.names:
+            self._unindex_name(name, entity)
+        if self._entity_index is not None:
+            self._entity_index.remove(entity)
+        self._descriptionless.pop(entity, None)
+        ctx = context.active()
+        ctx.kg.journal_move(entity)
+        if ctx.kg_recorder:
+            ctx.kg_recorder.entity_removed(self, entity)
+
+    def _index_description(self, entity):
+        """ Makes entity retrievable by its description at this location. """
+        if entity.description:
+            self._descriptionless.pop(entity, None)
+        else:
+            self._descriptionless[entity] = None
+        if self._entity_index is None:
+            if not entity.description:
+                return
+            self._entity_index = DescriptionIndex(dim=256)
+        self._entity_index.add(entity, entity.description)
+
+    def _index_name(self, name, entity):
+        """ Makes entity retrievable by name at this location. """
+        entities = self._entities_by_name.setdefault(name, [])
+        if entity not in entities:
+            entities.append(entity)
+
+    def _unindex_name(self, name, entity):
+        """ Removes the name to entity mapping from this location. """
+        entities = self._entities_by_name.get(name)
+        if entities and entity in entities:
+            entities.remove(entity)
+            if not entities:
+                del self._entities_by_name[name]
 
     def get_entity_by_name(self, entity_name):
         """
@@ -50,10 +108,8 @@ class Location:
         location or None if no such entity exists.
 
         """
-        for entity in self.entities:
-            if entity.has_name(entity_name):
-                return entity
-        return None
+        entities = self._entities_by_name.get(entity_name)
+        return entities[0] if entities else None
 
     def get_entity_by_description(self, entity_description):
         """
@@ -61,14 +117,20 @@ class Location:
         location or None if no such entity exists.
 
         """
-        for entity in self.entities:
-            if fuzz.partial_ratio(entity.description, entity_description) > 95:
-                return entity
-        return None
+        if self._entity_index is None:
+            return None
+        entity, confidence = self._entity_index.best_match(entity_description,
+                                                           accept_similarity=.95)
+        return entity if confidence > .95 else None
+
+    @property
+    def descriptionless_entities(self):
+        """ Returns the entities at this location that have no description. """
+        return list(self._descriptionless)
 
     def del_entity(self, entity):
         if entity in self._entities:
-            self._entities.remove(entity)
+            self._remove_entity(entity)
         else:
             gv.logger.warning("WARNING Location.del_entity could not find entity {}".format(entity.name))
 
@@ -90,8 +152,13 @@ class Location:
         """ Records an action, the probability it succeeded, and the text response. """
         if not isinstance(action, Action):
             raise ValueError("Expected Action. Got {}".format(type(action)))
+        ctx = context.active()
+        result_text = ctx.text_pool.get(result_text)
         self._action_records[action] = (p_valid, result_text)
-        gv.event_stream.push(NewActionRecordEvent(self, action, result_text))
+        ctx.kg.index_action_record(self, action)
+        if ctx.kg_recorder:
+            ctx.kg_recorder.action_recorded(self, action, p_valid, result_text)
+        ctx.event_stream.push(NewActionRecordEvent(self, action, result_text))
 
     def has_action_record(self, action):
         if not isinstance(action, Action):
@@ -104,20 +171,6 @@ class Location:
             raise ValueError("Expected Action. Got {}".format(type(action)))
         return self.action_records[action] if self.has_action_record(action) else None
 
-    def reset(self):
-        """ Reset to a state resembling start of game. """
-        # Move all the entities back to their original locations
-        to_remove = []
-        for entity in self.entities:
-            entity.reset()
-            init_loc = entity._init_loc
-            if init_loc == self:
-                continue
-            init_loc.add_entity(entity)
-            to_remove.append(entity)
-        for entity in to_remove:
-            self.entities.remove(entity)
-
     def to_string(self, prefix=''):
         s = prefix + "Location: {}".format(self.name)
         for entity in self._entities:
@@ -137,23 +190,20 @@ class Inventory(Location):
     Player inventory is represented as a location.
 
     """
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
         self._name = 'Inventory'
 
     def __iter__(self):
-        self._index = 0
-        return self
+        return iter(self._entities)
 
-    def __next__(self):
-        if self._index == len(self.entities):
-            raise StopIteration
-        entity = self.entities[self._index]
-        self._index += 1
-        return entity
+    def __contains__(self, entity):
+        return entity in self._entities
 
     def remove(self, entity):
-        self._entities.remove(entity)
+        self._remove_entity(entity)
 
     def __str__(self):
         return "Inventory: " + str(', '.join([item.name for item in self.entities]))
@@ -0,0 +1,72 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import util
+from valid_detectors.learned_valid_detector import predict_batch
+
+
+class LockstepDriver:
+    """
+    Advances several environments and their agents together, one step at a
+    time, in one process.
+
+    Once every environment has stepped, the new observations are parsed by
+    spaCy and scored by the validity model in batched calls. The results go
+    into the shared model caches (util.parse, learned_valid_detector.predict),
+    where each agent finds them as it continues. The LM caches are shared
+    the same way. Since only model outputs are shared, each agent makes the
+    same decisions it would make running on its own.
+
+    @args
+    agents: One NailAgent per environment
+    envs: Environments with the FrotzEnv interface
+
+    """
+    def __init__(self, agents, envs):
+        assert len(agents) == len(envs)
+        self.agents     = agents
+        self.envs       = envs
+        self.obs        = None
+        self.scores     = [0] * len(envs)
+        self.max_scores = [0] * len(envs)
+
+    def reset(self):
+        self.obs = [env.reset() for env in self.envs]
+        self.prefetch(self.obs)
+
+    def prefetch(self, texts):
+        """ Runs the batched model calls the agents will need for the texts. """
+        # Agents see both the raw and the stripped observation.
+        texts = texts + [text.strip() for text in texts]
+        util.parse_batch(texts)
+        sentences = [util.first_sentence(text) for text in texts]
+        predict_batch([util.clean(text) for text in texts + sentences])
+
+    def step(self):
+        """ Takes one step in every environment. Returns the actions taken. """
+        actions = [agent.take_action(obs) for agent, obs in zip(self.agents, self.obs)]
+        transitions = [env.step(action) for env, action in zip(self.envs, actions)]
+        self.prefetch([new_obs for new_obs, _, _, _ in transitions])
+        reset_obs = []
+        for i, (agent, action, (new_obs, score, done, info)) in \
+                enumerate(zip(self.agents, actions, transitions)):
+            agent.observe(self.obs[i], action, score, new_obs, done)
+            self.scores[i] = score
+            self.max_scores[i] = max(self.max_scores[i], score)
+            if done:
+                new_obs = self.envs[i].reset()
+                reset_obs.append(new_obs)
+            self.obs[i] = new_obs
+        if reset_obs:
+            self.prefetch(reset_obs)
+        return actions
+
+    def run(self, steps):
+        """
+        Runs every agent for the given number of steps. Returns the
+        (final score, best score) of each environment.
+
+        """
+        self.reset()
+        for _ in range(steps):
+            self.step()
+        return list(zip(self.scores, self.max_scores))
@@ -0,0 +1,214 @@
+import os, sys, json, tracemalloc
+import numpy as np
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from util import LruCache
+from gv import component_dbg
+
+dbg = component_dbg('agent')
+
+AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
+STDLIB_DIR = os.path.dirname(os.__file__)
+
+# Arrays count with their data, e.g. the matrices of the DescriptionIndexes.
+_sized_types = (str, bytes, int, float, bool, type(None), np.ndarray)
+
+
+class MemoryProfiler:
+    """
+    Samples the memory of an agent every interval steps, to find what grows
+    over long runs. Each sample records:
+
+    subsystems: Memory traced by tracemalloc, by the module that allocated
+                it: agent modules by path, e.g. 'decision_modules/examiner',
+                other packages by name, and 'python' for the standard library.
+    structures: Size and number of items of the agent's structures that can
+                grow without bound, e.g. the action records, the text pool,
+                the event stream, the knowledge graph's indexes and the
+                model caches. Sizes count the containers with the strings and
+                numbers they hold, each once; the entities and locations they
+                refer to belong to the knowledge graph and aren't counted.
+
+    The report saved by save gives the growth of each per 1000 steps, the
+    slope of a least-squares fit over the samples, largest first.
+
+    tracemalloc slows the agent down severalfold, so this is meant for
+    profiling runs only.
+
+    @args
+    interval: Number of steps between two samples
+
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples  = []
+        self._start_tracing()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_tracing']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._start_tracing()
+
+    def _start_tracing(self):
+        self._tracing = not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+
+    def due(self, step_num):
+        return step_num % self.interval == 0
+
+    def sample(self, agent):
+        """ Records the memory of agent at its current step. """
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)])
+        subsystems = {}
+        for stat in snapshot.statistics('filename'):
+            name = subsystem(stat.traceback[0].filename)
+            subsystems[name] = subsystems.get(name, 0) + stat.size
+        traced, peak = tracemalloc.get_traced_memory()
+        self.samples.append({'step': agent.step_num,
+                             'traced': traced,
+                             'traced_peak': peak,
+                             'rss': rss(),
+                             'subsystems': subsystems,
+                             'structures': structures(agent)})
+        dbg("[MEM] step {} traced {:.1f}MB".format(agent.step_num, traced / 1048576.))
+
+    def growth(self):
+        """
+        Returns the growth per 1000 steps of the traced memory, the RSS, and
+        each subsystem and structure, in bytes.
+
+        """
+        steps = [s['step'] for s in self.samples]
+        def per_1000(values):
+            return round(slope(steps, values) * 1000)
+        def by_name(field, key=lambda v: v):
+            names = set(name for s in self.samples for name in s[field])
+            growth = dict((name, per_1000([key(s[field].get(name, 0)) for s in self.samples]))
+                          for name in names)
+            return dict(sorted(growth.items(), key=lambda item: -item[1]))
+        return {'traced': per_1000([s['traced'] for s in self.samples]),
+                'rss': per_1000([s['rss'] or 0 for s in self.samples]),
+                'subsystems': by_name('subsystems'),
+                'structures': by_name('structures', lambda v: v['bytes'] if v else 0),
+                'structure_items': by_name('structures', lambda v: v['items'] if v else 0)}
+
+    def save(self, path):
+        """ Writes the samples and growth per 1000 steps to path as JSON. """
+        with open(path, 'w') as f:
+            json.dump({'interval': self.interval,
+                       'growth_per_1000_steps': self.growth(),
+                       'samples': self.samples}, f, indent=2)
+
+    def close(self):
+        """ Stops tracing if it was started here. """
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+
+def subsystem(filename):
+    """ Returns the name of the subsystem a source file belongs to. """
+    if filename.startswith(AGENT_DIR + os.sep):
+        return os.path.splitext(os.path.relpath(filename, AGENT_DIR))[0]
+    parts = filename.split(os.sep)
+    if 'site-packages' in parts:
+        package = parts[parts.index('site-packages') + 1]
+        return os.path.splitext(package)[0]
+    if filename.startswith((STDLIB_DIR, '<frozen')):
+        return 'python'
+    return filename
+
+
+def structures(agent):
+    """ Returns {name: {'bytes', 'items'}} of the structures of agent that may grow. """
+    kg = agent.knowledge_graph
+    locations = list(kg.locations) + [kg.inventory]
+    entities, seen = [], set()
+    pending = [e for l in locations for e in l.entities]
+    while pending:
+        entity = pending.pop()
+        if id(entity) not in seen:
+            seen.add(id(entity))
+            entities.append(entity)
+            pending.extend(entity._entities)
+
+    indexes = [kg._location_index] + [l._entity_index for l in locations if l._entity_index]
+    modules = dict((type(module).__name__, module) for module in agent.modules)
+    interactor = modules['Interactor']
+    extractor = interactor._affordance_extractor
+    named = {
+        'location_action_records': [l._action_records for l in locations],
+        'entity_action_records': [e._action_records for e in entities],
+        'context_text_pool': [agent.ctx.text_pool._texts],
+        'event_stream': [agent.ctx.event_stream._stream],
+        'description_index_matrices': [i._vectors for i in indexes if i._vectors is not None],
+        'description_index_texts': [part for i in indexes for part in (i._texts, i._exact)],
+        'kg_name_indexes': [kg._locations_by_name] + [l._entities_by_name for l in locations],
+        'kg_untried_nav': [kg._untried_nav, kg._unexplored],
+        'kg_attribute_index': [kg._entities_by_attr],
+        'kg_descriptionless': [l._descriptionless for l in locations],
+        'kg_journal': [kg._journal, kg._moved_entities],
+        'examiner_to_examine': [modules['Examiner']._to_examine],
+        'interactor_actions_that_caused_death': [interactor.actions_that_caused_death],
+        'lm_extractor_caches': [extractor.cached_extractions, extractor.cached_unknown_actions,
+                                extractor.cached_double_object_actions, extractor.action_prior_table],
+    }
+    sizes = {}
+    for name, parts in named.items():
+        seen = set()
+        sizes[name] = {'bytes': sum(deep_size(part, seen) for part in parts),
+                       'items': sum(len(part) for part in parts)}
+    # The model caches are shared by the agents of the process.
+    for name, cache in sorted(LruCache.named.items()):
+        sizes['cache_' + name] = {'bytes': deep_size(cache._items), 'items': len(cache)}
+    return sizes
+
+
+def deep_size(obj, seen=None):
+    """
+    Returns the size in bytes of a container with the containers, strings
+    and numbers it holds. Other objects aren't counted, nor anything twice.
+
+    """
+    seen = set() if seen is None else seen
+    size, pending = 0, [obj]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, dict):
+            pending.extend(obj.keys())
+            pending.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            pending.extend(obj)
+        elif not isinstance(obj, _sized_types):
+            continue
+        size += sys.getsizeof(obj)
+    return size
+
+
+def slope(xs, ys):
+    """ Returns the slope of the least-squares line through the points, 0 for fewer than 2. """
+    n = len(xs)
+    if n < 2:
+        return 0.
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    var = sum((x - mean_x) ** 2 for x in xs)
+    if not var:
+        return 0.
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var
+
+
+def rss():
+    """ Returns the resident set size of the process in bytes, or None without /proc. """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, ValueError, IndexError):
+        return None
@@ -0,0 +1,183 @@
+import os, sys, time, bisect, itertools, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from util import LruCache
+
+# Upper bounds of the buckets of the winning eagerness histogram.
+EAGERNESS_BUCKETS = (0., .1, .2, .3, .4, .5, .6, .7, .8, .9, 1.)
+
+
+class ElectionStats:
+    """
+    Which modules won the elections of an agent, and with what eagerness.
+    Kept by NailAgent as its election_stats.
+
+    """
+    def __init__(self):
+        self.wins      = {} # Module name : elections won
+        self.eagerness = [0] * (len(EAGERNESS_BUCKETS) + 1)
+        self.eagerness_sum = 0.
+
+    def elected(self, module_name, eagerness):
+        self.wins[module_name] = self.wins.get(module_name, 0) + 1
+        self.eagerness[bisect.bisect_left(EAGERNESS_BUCKETS, eagerness)] += 1
+        self.eagerness_sum += eagerness
+
+
+class MetricsExporter:
+    """
+    Exposes live counters of running agents in the Prometheus text format,
+    so that stuck or slow games can be spotted while they run: steps,
+    steps/sec, score, locations, entities and unrecognized words known,
+    the modules that won the elections and their eagerness, and the hit
+    rates of the model caches.
+
+    The metrics are served on http://127.0.0.1:<port>/metrics if port is
+    given, and rewritten to path every interval seconds if path is given,
+    e.g. for the textfile collector of a node exporter. Both run on daemon
+    threads and never lock the knowledge graphs: they read the counters the
+    agents publish at the end of each step (NailAgent.graph_counts), so a
+    slow or stuck step doesn't hold up the metrics.
+
+    @args
+    path: File the metrics are periodically written to, or None
+    port: Local port the metrics are served on, or None
+    interval: Seconds between two writes of path
+
+    """
+    def __init__(self, path=None, port=None, interval=10.):
+        self.path     = path
+        self.interval = interval
+        self._agents  = [] # (agent, start time, start step)
+        self._lock    = threading.Lock()
+        self._stopped = threading.Event()
+        self._server  = None
+        self._threads = []
+        if port is not None:
+            self._server = ThreadingHTTPServer(('127.0.0.1', port), _handler(self))
+            self._start(self._server.serve_forever)
+        if path is not None:
+            self._start(self._write_loop)
+
+    def _start(self, target):
+        thread = threading.Thread(target=target, name='nail-metrics', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    @property
+    def port(self):
+        """ Port the metrics are served on, e.g. when started on port 0. """
+        return self._server.server_address[1] if self._server else None
+
+    def add(self, agent):
+        """ Exports the metrics of agent. """
+        with self._lock:
+            self._agents.append((agent, time.time(), agent.step_num))
+
+    def remove(self, agent):
+        with self._lock:
+            self._agents = [entry for entry in self._agents if entry[0] is not agent]
+
+    def render(self):
+        """ Returns the current metrics in the Prometheus text format. """
+        lines = []
+        def metric(name, kind, help_text, samples):
+            """ Adds a metric from its samples (name suffix, labels, value). """
+            lines.append('# HELP nail_{} {}'.format(name, help_text))
+            lines.append('# TYPE nail_{} {}'.format(name, kind))
+            for suffix, labels, value in samples:
+                lines.append('nail_{}{}{{{}}} {}'.format(name, suffix, ','.join(
+                    '{}="{}"'.format(k, _escape(v)) for k, v in labels), value))
+
+        with self._lock:
+            agents = list(self._agents)
+        now = time.time()
+        rows = [] # (labels, agent, locations, entities, unrecognized words, steps/sec)
+        for agent, start, start_step in agents:
+            locations, entities, unrecognized = agent.graph_counts
+            steps_per_sec = (agent.step_num - start_step) / (now - start) if now > start else 0.
+            rows.append(([('game', agent.rom_name), ('seed', agent.seed)], agent,
+                         locations, entities, unrecognized, round(steps_per_sec, 3)))
+
+        def per_agent(value):
+            return [('', row[0], value(row)) for row in rows]
+        metric('steps_total', 'counter', 'Steps taken.', per_agent(lambda r: r[1].step_num))
+        metric('steps_per_second', 'gauge', 'Mean steps per second since the agent was added.',
+               per_agent(lambda r: r[5]))
+        metric('score', 'gauge', 'Current score.', per_agent(lambda r: r[1].score))
+        metric('max_score', 'gauge', 'Best score.', per_agent(lambda r: r[1].max_score))
+        metric('locations', 'gauge', 'Locations known.', per_agent(lambda r: r[2]))
+        metric('entities', 'gauge', 'Entities known.', per_agent(lambda r: r[3]))
+        metric('unrecognized_words', 'gauge', 'Words the game did not recognize.',
+               per_agent(lambda r: r[4]))
+        metric('missed_deadlines_total', 'counter', 'Steps that ran over the step budget.',
+               per_agent(lambda r: r[1].missed_deadlines))
+
+        elections, eagerness = [], []
+        for labels, agent, *_ in rows:
+            stats = agent.election_stats
+            wins, counts = dict(stats.wins), list(stats.eagerness)
+            for module, won in sorted(wins.items()):
+                elections.append(('', labels + [('module', module)], won))
+            for bound, count in zip(EAGERNESS_BUCKETS + ('+Inf',), itertools.accumulate(counts)):
+                eagerness.append(('_bucket', labels + [('le', bound)], count))
+            eagerness.append(('_sum', labels, round(stats.eagerness_sum, 6)))
+            eagerness.append(('_count', labels, sum(counts)))
+        metric('elections_total', 'counter', 'Elections won by each module.', elections)
+        metric('winning_eagerness', 'histogram', 'Eagerness of the modules that won the elections.',
+               eagerness)
+
+        caches = sorted(LruCache.named.items())
+        def per_cache(value):
+            return [('', [('cache', name)], value(cache)) for name, cache in caches]
+        metric('cache_hits_total', 'counter', 'Hits of the model caches, shared by the process.',
+               per_cache(lambda c: c.hits))
+        metric('cache_misses_total', 'counter', 'Misses of the model caches.',
+               per_cache(lambda c: c.misses))
+        metric('cache_hit_ratio', 'gauge', 'Fraction of the model cache lookups that hit.',
+               per_cache(lambda c: round(c.hits / max(1, c.hits + c.misses), 4)))
+        metric('cache_entries', 'gauge', 'Entries in the model caches.', per_cache(len))
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """ Writes the metrics to path, replacing the previous ones at once. """
+        with open(self.path + '.tmp', 'w') as f:
+            f.write(self.render())
+        os.replace(self.path + '.tmp', self.path)
+
+    def _write_loop(self):
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+    def close(self):
+        """ Stops serving and writes the final metrics to path. """
+        self._stopped.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        if self.path is not None:
+            self.write()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _handler(exporter):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = exporter.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Scrapes aren't worth logging
+    return MetricsHandler
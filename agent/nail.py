@@ -1,11 +1,22 @@
-import os, sys, queue, logging
+import os, sys, time, queue, logging, asyncio
+from contextlib import contextmanager
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from decision_modules import Examiner, Interactor, Navigator, Hoarder, YesNo, YouHaveTo, Darkness, Idler
 from event import *
 from knowledge_graph import *
-from gv import kg, event_stream, dbg, rng
+from gv import component_dbg
+import context
+from context import AgentContext
 from util import clean, action_recognized
 from valid_detectors.learned_valid_detector import LearnedValidDetector
+from kg_snapshot import KnowledgeGraphRecorder, save_knowledge_graph, load_knowledge_graph
+from timing import PhaseTimer, phase
+from checkpoint import Checkpointer, load_checkpoint
+from agent_log import AgentLogHandler
+from metrics import ElectionStats
+from memory_profile import MemoryProfiler
+
+dbg = component_dbg('agent')
 
 
 class NailAgent():
@@ -16,30 +27,90 @@ class NailAgent():
     actions. Changes in world-state and knowledge_graph stream events to the
     decision modules. The modules then update how eager they are to take control.
 
+    If snapshot_kg is set, the changes made to the knowledge graph during each
+    step are written to kgs/<rom_name>.jsonl (see kg_snapshot.load_snapshot).
+
+    If kg_path is given, the agent warm-starts from a knowledge graph saved by
+    save_knowledge_graph for the same rom, rather than exploring from scratch.
+
+    All of the agent's mutable state lives in its own AgentContext, so several
+    agents may run in one process and share the loaded models.
+
+    If timing is set, the time spent in each phase of the steps is recorded
+    (see timing.PhaseTimer) and written to nail_logs/<rom_name>.timing.json
+    by finalize.
+
+    If checkpoint_interval is set, the agent's full state is saved to
+    checkpoints/ about every checkpoint_interval steps (see
+    checkpoint.Checkpointer), and the run can be continued with resume.
+
+    If step_budget is set, the agent has that many seconds to respond to each
+    observation, from observe until take_action returns. Expensive work is
+    cut short once the time is up and finished in later steps, and the most
+    eager module found so far takes control, down to the Idler. Steps that
+    still run over are counted in missed_deadlines.
+
+    The log file is written by a background thread (see agent_log). If
+    log_max_bytes is set it is rotated at that size, and the rotated files
+    are gzipped if compress_logs is set.
+
+    If memory_interval is set, the agent's memory is sampled every
+    memory_interval steps (see memory_profile.MemoryProfiler) and its growth
+    written to nail_logs/<rom_name>.memory.json by finalize.
+
     """
-    def __init__(self, seed, env, rom_name, output_subdir='.'):
+    def __init__(self, seed, env, rom_name, output_subdir='.', snapshot_kg=False,
+                 kg_path=None, timing=False, checkpoint_interval=0, step_budget=None,
+                 log_max_bytes=0, compress_logs=False, memory_interval=0):
+        self.ctx              = AgentContext(seed)
+        self.ctx.timer        = PhaseTimer() if timing else None
+        self.knowledge_graph  = self.ctx.kg
+        self.log_max_bytes    = log_max_bytes
+        self.compress_logs    = compress_logs
         self.setup_logging(rom_name, output_subdir)
-        rng.seed(seed)
-        dbg("RandomSeed: {}".format(seed))
-        self.knowledge_graph  = gv.kg
-        self.knowledge_graph.__init__() # Re-initialize KnowledgeGraph
-        gv.event_stream.clear()
-        self.modules = [Examiner(True), Hoarder(True), Navigator(True), Interactor(True),
-                        Idler(True), YesNo(True), YouHaveTo(True), Darkness(True)]
-        self.active_module    = None
-        self.action_generator = None
-        self.first_step       = True
-        self._valid_detector  = LearnedValidDetector()
-        if env and rom_name:
-            self.env = env
-            self.step_num = 0
+        with self.ctx.activate():
+            dbg("RandomSeed: {}".format(seed))
+            self.seed     = seed
+            self.rom_name = rom_name
+            if kg_path:
+                self.load_knowledge_graph(kg_path)
+            self.kg_recorder = None
+            if snapshot_kg:
+                self.kg_recorder = KnowledgeGraphRecorder(
+                    self.knowledge_graph, os.path.join(self.kgs_dir_path, rom_name + '.jsonl'))
+                if kg_path:
+                    self.kg_recorder.record_graph()
+            self.ctx.kg_recorder = self.kg_recorder
+            self.checkpointer = None
+            if checkpoint_interval:
+                self.checkpointer = Checkpointer(os.path.join(output_subdir, 'checkpoints'),
+                                                 rom_name, checkpoint_interval)
+            ctx = self.ctx
+            self.modules = [Examiner(ctx, True), Hoarder(ctx, True), Navigator(ctx, True),
+                            Interactor(ctx, True), Idler(ctx, True), YesNo(ctx, True),
+                            YouHaveTo(ctx, True), Darkness(ctx, True)]
+            self.active_module    = None
+            self.action_generator = None
+            self.first_step       = True
+            self._valid_detector  = LearnedValidDetector(self.knowledge_graph)
+            if env and rom_name:
+                self.env = env
+                self.step_num = 0
+            self.score     = 0
+            self.max_score = 0
+            self.step_budget      = step_budget
+            self.missed_deadlines = 0
+            self.election_stats   = ElectionStats()
+            self.memory_profiler  = MemoryProfiler(memory_interval) if memory_interval else None
+            self.publish_graph_counts()
 
 
     def setup_logging(self, rom_name, output_subdir):
-        """ Configure the logging facilities. """
-        for handler in logging.root.handlers[:]:
-            handler.close()
-            logging.root.removeHandler(handler)
+        """
+        Configure the logging facilities. Messages logged while the agent's
+        context is active go to the agent's own log file.
+
+        """
         self.logpath = os.path.join(output_subdir, 'nail_logs')
         if not os.path.exists(self.logpath):
             os.mkdir(self.logpath)
@@ -47,22 +118,46 @@ class NailAgent():
         if not os.path.exists(self.kgs_dir_path):
             os.mkdir(self.kgs_dir_path)
         self.logpath = os.path.join(self.logpath, rom_name)
-        logging.basicConfig(format='%(message)s', filename=self.logpath+'.log',
-                            level=logging.DEBUG, filemode='w')
+        self.open_log(mode='w')
+
+
+    def open_log(self, mode):
+        """ Opens the agent's log file and starts logging its messages to it. """
+        self.log_handler = AgentLogHandler(self.logpath+'.log',
+                                           lambda record: context.current() is self.ctx,
+                                           mode=mode, max_bytes=self.log_max_bytes,
+                                           compress=self.compress_logs)
+        gv.logger.addHandler(self.log_handler)
 
 
     def elect_new_active_module(self):
         """ Selects the most eager module to take control. """
-        most_eager = 0.
-        for module in self.modules:
-            eagerness = module.get_eagerness()
-            if eagerness >= most_eager:
-                self.active_module = module
-                most_eager = eagerness
-        dbg("[NAIL](elect): {} Eagerness: {}"\
-            .format(type(self.active_module).__name__, most_eager))
-        self.action_generator = self.active_module.take_control()
-        self.action_generator.send(None)
+        timer = self.ctx.timer
+        with phase(timer, 'elect_new_active_module'):
+            most_eager = 0.
+            for module in self.modules:
+                if timer is None:
+                    eagerness = module.get_eagerness()
+                else:
+                    eagerness = timer.call(type(module).__name__ + '.get_eagerness',
+                                           module.get_eagerness)
+                if eagerness >= most_eager:
+                    self.active_module = module
+                    most_eager = eagerness
+            dbg("[NAIL](elect): {} Eagerness: {}"\
+                .format(type(self.active_module).__name__, most_eager))
+            self.election_stats.elected(type(self.active_module).__name__, most_eager)
+            self.action_generator = self.active_module.take_control()
+            self.send_to_active_module(None)
+
+
+    def send_to_active_module(self, observation):
+        """ Resumes the active module's take_control generator with observation. """
+        timer = self.ctx.timer
+        if timer is None:
+            return self.action_generator.send(observation)
+        return timer.call(type(self.active_module).__name__ + '.take_control',
+                          self.action_generator.send, observation)
 
 
     def generate_next_action(self, observation):
@@ -73,65 +168,227 @@ class NailAgent():
         next_action = None
         while not next_action:
             try:
-                next_action = self.action_generator.send(observation)
+                next_action = self.send_to_active_module(observation)
             except StopIteration:
                 self.consume_event_stream()
+                self.checkpoint_if_due(observation)
                 self.elect_new_active_module()
         return next_action.text()
 
 
     def consume_event_stream(self):
         """ Each module processes stored events then the stream is cleared. """
-        for module in self.modules:
-            module.process_event_stream()
-        event_stream.clear()
+        with phase(self.ctx.timer, 'consume_event_stream'):
+            for module in self.modules:
+                module.process_event_stream()
+            self.ctx.event_stream.clear()
 
 
     def take_action(self, observation):
-        if self.env:
-            # Add true locations to the .log file.
-            loc = self.env.get_player_location()
-            if loc and hasattr(loc, 'num') and hasattr(loc, 'name') and loc.num and loc.name:
-                dbg("[TRUE_LOC] {} \"{}\"".format(loc.num, loc.name))
+        """
+        Returns the next action. The knowledge graph is write-locked while
+        the agent updates it; other threads may read it between steps.
+
+        """
+        kg = self.knowledge_graph
+        with kg.lock.write(), self.ctx.activate(), phase(self.ctx.timer, 'take_action'), \
+             self.step_deadline(end=True):
+            if self.env:
+                # Add true locations to the .log file.
+                loc = self.env.get_player_location()
+                if loc and hasattr(loc, 'num') and hasattr(loc, 'name') and loc.num and loc.name:
+                    dbg("[TRUE_LOC] {} \"{}\"".format(loc.num, loc.name))
 
-            # Output a snapshot of the kg.
-            # with open(os.path.join(self.kgs_dir_path, str(self.step_num) + '.kng'), 'w') as f:
-            #     f.write(str(self.knowledge_graph)+'\n\n')
-            # self.step_num += 1
+                # Output the changes to the kg since the last step.
+                if self.kg_recorder:
+                    self.kg_recorder.snapshot(self.step_num)
+                self.step_num += 1
 
-        observation = observation.strip()
-        if self.first_step:
-            dbg("[NAIL] {}".format(observation))
-            self.first_step = False
-            return 'look' # Do a look to get rid of intro text
+            observation = observation.strip()
+            if self.first_step:
+                dbg("[NAIL] {}".format(observation))
+                self.first_step = False
+                return 'look' # Do a look to get rid of intro text
 
-        if not kg.player_location:
-            loc = Location(observation)
-            kg.add_location(loc)
-            kg.player_location = loc
-            kg._init_loc = loc
+            if not kg.player_location:
+                loc = kg._init_loc # Known when warm-started
+                if not loc:
+                    loc = Location(observation)
+                    kg.add_location(loc)
+                    kg._init_loc = loc
+                kg.player_location = loc
 
-        self.consume_event_stream()
+            self.consume_event_stream()
 
-        if not self.active_module:
-            self.elect_new_active_module()
+            if not self.active_module:
+                self.checkpoint_if_due(observation)
+                self.elect_new_active_module()
 
-        next_action = self.generate_next_action(observation)
-        return next_action
+            next_action = self.generate_next_action(observation)
+            return next_action
 
 
     def observe(self, obs, action, score, new_obs, terminal):
         """ Observe will be used for learning from rewards. """
-        p_valid = self._valid_detector.action_valid(action, new_obs)
-        dbg("[VALID] p={:.3f} {}".format(p_valid, clean(new_obs)))
-        if kg.player_location:
-            dbg("[EAGERNESS] {}".format(' '.join([str(module.get_eagerness()) for module in self.modules[:5]])))
-        event_stream.push(NewTransitionEvent(obs, action, score, new_obs, terminal))
-        action_recognized(action, new_obs) # Update the unrecognized words
-        if terminal:
-            kg.reset()
+        kg = self.knowledge_graph
+        with kg.lock.write(), self.ctx.activate(), phase(self.ctx.timer, 'observe'), \
+             self.step_deadline(end=False):
+            p_valid = self._valid_detector.action_valid(action, new_obs)
+            dbg("[VALID] p={:.3f} {}".format(p_valid, clean(new_obs)))
+            if kg.player_location:
+                dbg("[EAGERNESS] {}".format(' '.join([str(module.get_eagerness()) for module in self.modules[:5]])))
+            self.score = score
+            self.max_score = max(self.max_score, score)
+            self.ctx.event_stream.push(NewTransitionEvent(obs, action, score, new_obs, terminal))
+            action_recognized(action, new_obs, kg) # Update the unrecognized words
+            if terminal:
+                kg.reset()
+            self.publish_graph_counts()
+        if self.memory_profiler and self.memory_profiler.due(self.step_num):
+            with kg.lock.write(), self.ctx.activate():
+                self.memory_profiler.sample(self)
+
+
+    def publish_graph_counts(self):
+        """
+        Publishes the numbers of locations, entities and unrecognized words
+        known, as one tuple that other threads, e.g. the MetricsExporter,
+        can read without locking the knowledge graph.
+
+        """
+        kg = self.knowledge_graph
+        entities = sum(len(l.entities) for l in kg.locations) + len(kg.inventory.entities)
+        self.graph_counts = (len(kg.locations), entities, len(kg.unrecognized_words))
+
+
+    @contextmanager
+    def step_deadline(self, end):
+        """
+        Starts the deadline of the step, if there is a step budget and it
+        hasn't started yet in observe. If end is set, the deadline ends with
+        the with block and is counted if missed.
+
+        """
+        ctx = self.ctx
+        if not self.step_budget:
+            yield
+            return
+        if ctx.deadline is None:
+            ctx.deadline = time.perf_counter() + self.step_budget
+        try:
+            yield
+        finally:
+            if end:
+                overrun = time.perf_counter() - ctx.deadline
+                if overrun > 0:
+                    self.missed_deadlines += 1
+                    dbg("[NAIL] Missed the deadline by {:.3f}s".format(overrun))
+                ctx.deadline = None
+
+
+    def checkpoint_if_due(self, observation):
+        """
+        Takes a checkpoint if one is due. Called before electing a module,
+        when no module is part way through its actions.
+
+        """
+        if self.checkpointer and self.checkpointer.due(self.step_num):
+            self.checkpointer.save(self, observation)
+
+
+    def __getstate__(self):
+        """
+        The state saved in a checkpoint. The environment, log file and kg
+        recorder belong to the running process. Checkpoints are taken part
+        way through a step, which is taken again on resume, so a new module
+        is elected and the step isn't counted twice.
+
+        """
+        state = self.__dict__.copy()
+        for name in ('env', 'log_handler', 'kg_recorder', 'active_module', 'action_generator'):
+            state[name] = None
+        state['step_num'] = self.step_num - 1
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.open_log(mode='a')
+
+
+    @classmethod
+    def resume(cls, path, env):
+        """
+        Restores an agent and its environment from a checkpoint. Returns the
+        agent and the observation to pass to its next take_action; the run
+        then continues as it would have without interruption. Snapshots of
+        the knowledge graph are not recorded after resuming.
+
+        """
+        checkpoint = load_checkpoint(path)
+        env.set_state(checkpoint['env_state'])
+        agent = checkpoint['agent']
+        agent.env = env
+        if agent.checkpointer:
+            agent.checkpointer.start()
+        with agent.ctx.activate():
+            dbg("[NAIL] Resumed from {} at step {}".format(path, checkpoint['step']))
+        return agent, checkpoint['observation']
+
+
+    async def take_action_async(self, observation, executor=None):
+        """
+        Coroutine version of take_action. The step runs in executor (the
+        loop's default executor if None), so the event loop can meanwhile
+        advance other games.
+
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self.take_action, observation)
+
+
+    async def observe_async(self, obs, action, score, new_obs, terminal, executor=None):
+        """ Coroutine version of observe, run in executor. """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(executor, self.observe, obs, action, score,
+                                   new_obs, terminal)
+
+
+    def load_knowledge_graph(self, path):
+        """
+        Warm-starts from a saved knowledge graph before the first step. The
+        modules learn the loaded locations and entities from their discovery
+        events on the first step, which also relocalizes the player.
+
+        """
+        kg = self.knowledge_graph
+        load_knowledge_graph(path, self.rom_name, kg)
+        kg._player_location = None
+        dbg("[NAIL] Loaded knowledge graph {} with {} locations".format(path, len(kg.locations)))
+
+
+    def save_knowledge_graph(self, path):
+        """ Saves the knowledge graph for warm-starting later runs. """
+        save_knowledge_graph(self.knowledge_graph, path, self.rom_name)
+
+
+    def timings(self):
+        """ Returns the phase timings so far as a dict, or None if timing is off. """
+        return self.ctx.timer.to_dict() if self.ctx.timer else None
 
 
     def finalize(self):
         with open(self.logpath+'.kng', 'w') as f:
             f.write(str(self.knowledge_graph)+'\n\n')
+        if self.ctx.timer:
+            self.ctx.timer.save(self.logpath+'.timing.json')
+        if self.kg_recorder:
+            self.kg_recorder.snapshot(self.step_num)
+            self.kg_recorder.close()
+        if self.checkpointer:
+            self.checkpointer.close()
+        if self.memory_profiler:
+            self.memory_profiler.save(self.logpath+'.memory.json')
+            self.memory_profiler.close()
+        gv.logger.removeHandler(self.log_handler)
+        self.log_handler.close()
@@ -0,0 +1,133 @@
+import os, sys, json, time, bisect
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import context
+
+# Upper bounds in seconds of the latency histogram buckets. One more bucket
+# counts the calls slower than the last bound.
+BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1., 10.)
+
+_untimed = nullcontext()
+
+# Set once a PhaseTimer exists in the process. Until then @timed functions
+# and active_timer return at once, without looking up the active context.
+_enabled = False
+
+
+class PhaseStats:
+    """ Call count, cumulative and maximum time and latency histogram of a phase. """
+    __slots__ = ('calls', 'total', 'max', 'histogram')
+
+    def __init__(self):
+        self.calls     = 0
+        self.total     = 0.
+        self.max       = 0.
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def to_dict(self):
+        return {'calls': self.calls,
+                'total': self.total,
+                'mean': self.total / self.calls if self.calls else 0.,
+                'max': self.max,
+                'histogram': dict(zip(['<={}'.format(b) for b in BUCKETS] + ['>{}'.format(BUCKETS[-1])],
+                                      self.histogram))}
+
+
+class PhaseTimer:
+    """
+    Times the phases of an agent's steps: take_action and observe, the
+    election and event processing, each module's get_eagerness,
+    process_event and take_control, and the model calls.
+
+    Phases nest, so the time of a phase includes that of the phases it
+    calls, e.g. take_action includes consume_event_stream.
+
+    Timing is off unless the agent's AgentContext.timer is set to a
+    PhaseTimer. When it is None the instrumented code only pays for
+    checking that.
+
+    """
+    def __init__(self):
+        self.phases = {}
+        enable()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        enable() # Restored from a checkpoint
+
+    def add(self, phase, seconds):
+        stats = self.phases.get(phase)
+        if stats is None:
+            stats = self.phases[phase] = PhaseStats()
+        stats.add(seconds)
+
+    @contextmanager
+    def time(self, phase):
+        """ Times the body of a with statement as phase. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def call(self, phase, fn, *args):
+        """ Calls fn(*args), timing it as phase. """
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def to_dict(self):
+        return dict((phase, stats.to_dict()) for phase, stats in sorted(self.phases.items()))
+
+    def save(self, path):
+        """ Writes the timings to path as JSON. """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def phase(timer, name):
+    """ Returns a context manager timing name with timer, or doing nothing if timer is None. """
+    return _untimed if timer is None else timer.time(name)
+
+
+def enable():
+    """ Turns on the timing of @timed functions, for the contexts that have a timer. """
+    global _enabled
+    _enabled = True
+
+
+def active_timer():
+    """ Returns the timer of the active context, or None if there is none. """
+    if not _enabled:
+        return None
+    ctx = context.current()
+    return ctx.timer if ctx is not None else None
+
+
+def timed(name):
+    """ Decorator timing calls of a function as phase name of the active context's timer. """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            timer = active_timer()
+            if timer is None:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timer.add(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
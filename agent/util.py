@@ -1,19 +1,193 @@
 import gv
 import event
+import context
+import timing
 import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from action import Action
 
+_dbg = gv.component_dbg('util')
+
+
+class TextPool:
+    """
+    Deduplicates game text so that equal strings share one object. Only
+    text kept by the knowledge graph is pooled: descriptions, action record
+    responses and connection messages. The pool is never pruned, so it
+    grows with the graph rather than with the number of steps.
+
+    """
+    __slots__ = ('_texts',)
+
+    def __init__(self):
+        self._texts = {}
+
+    def get(self, text):
+        """ Returns the pooled string equal to text. """
+        return self._texts.setdefault(text, text)
+
+    def clear(self):
+        self._texts.clear()
+
+    def __len__(self):
+        return len(self._texts)
+
+
+class LruCache:
+    """
+    Thread-safe memo of the most recently used results of a pure function,
+    such as a model prediction. Shared by all agents in the process.
+    Caches given a name are listed in LruCache.named, e.g. for metrics.
+
+    """
+    named = {} # Name : cache
+
+    def __init__(self, maxsize, name=None):
+        self._maxsize = maxsize
+        self._items   = OrderedDict()
+        self._lock    = threading.Lock()
+        self.hits     = 0
+        self.misses   = 0
+        if name:
+            LruCache.named[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self._maxsize:
+                self._items.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
+class ReadWriteLock:
+    """
+    Lets any number of threads read at once, or one thread write. Waiting
+    writers take precedence over new readers. The writing thread may
+    re-acquire either side of the lock without blocking.
+
+    """
+    def __init__(self):
+        self._cond    = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer  = None # Ident of the writing thread
+        self._depth   = 0    # Nesting depth of the writer
+        self._waiting = 0    # Number of waiting writers
+
+    def __getstate__(self):
+        return {} # Pickled unlocked
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    @contextmanager
+    def read(self):
+        """ Holds the lock for reading within a with block. """
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._depth += 1
+            else:
+                while self._writer is not None or self._waiting:
+                    self._cond.wait()
+                self._readers += 1
+        try:
+            yield
+        finally:
+            self._release(me)
+
+    @contextmanager
+    def write(self):
+        """ Holds the lock for writing within a with block. """
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                self._waiting += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._waiting -= 1
+                self._writer = me
+            self._depth += 1
+        try:
+            yield
+        finally:
+            self._release(me)
+
+    def _release(self, me):
+        with self._cond:
+            if self._writer == me:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._writer = None
+                    self._cond.notify_all()
+            else:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+
+class ParsedText:
+    """ What the agent uses from the spaCy parse of a text. """
+    __slots__ = ('tokens', 'noun_roots', 'first_sentence')
+
+    def __init__(self, doc):
+        self.tokens = [word.lower_ for word in doc]
+        self.noun_roots = [chunk.root.text.lower() for chunk in doc.noun_chunks]
+        sentence = next(doc.sents, None) # None for an empty text
+        self.first_sentence = sentence.merge().text if sentence is not None else '' # Modifies doc
+
+
+# Parses of recent texts. Game text repeats a lot across steps and agents.
+_parses = LruCache(20000, 'spacy')
+
+# spaCy pipelines aren't safe to run from several threads at once.
+_nlp_lock = threading.Lock()
+
+
+def parse(text):
+    """ Returns the ParsedText of text. """
+    parsed = _parses.get(text)
+    if parsed is None:
+        with _nlp_lock, timing.phase(timing.active_timer(), 'nlp'):
+            parsed = ParsedText(gv.nlp(text))
+        _parses.put(text, parsed)
+    return parsed
+
+
+def parse_batch(texts):
+    """ Parses the texts that aren't cached yet in a single spaCy pipe call. """
+    missing = list(OrderedDict.fromkeys(t for t in texts if t not in _parses))
+    with _nlp_lock, timing.phase(timing.active_timer(), 'nlp'):
+        parsed = [ParsedText(doc) for doc in gv.nlp.pipe(missing)]
+    for text, parsed_text in zip(missing, parsed):
+        _parses.put(text, parsed_text)
+
 
 def first_sentence(text):
     """ Extracts the first sentence from text. """
-    tokens = gv.nlp(text)
-    return next(tokens.sents).merge().text
+    return parse(text).first_sentence
 
 
 def tokenize(description):
     """ Returns a list of tokens in a string. """
-    doc = gv.nlp(description)
-    return [word.lower_ for word in doc]
+    return list(parse(description).tokens)
 
 
 def clean(s):
@@ -28,7 +202,7 @@ def move_entity(entity, origin, dest):
         .format(entity, origin)
     origin.del_entity(entity)
     dest.add_entity(entity)
-    gv.event_stream.push(event.EntityMovedEvent(entity, origin, dest))
+    context.active().event_stream.push(event.EntityMovedEvent(entity, origin, dest))
 
 
 # This list covers the common paterns. However, some games like
@@ -72,17 +246,16 @@ def get_unrecognized(action, response):
     return ''
 
 
-def action_recognized(action, response):
+def action_recognized(action, response, kg):
     """
     Returns True if the action was recognized based on the response.
-    Returns False if the action is not recognized and appends it to
-    the list of unrecognized_words.
+    Returns False if the action is not recognized and adds the word to
+    the unrecognized words of the knowledge graph kg.
 
     """
     unrecognized_word = get_unrecognized(action, response)
     if unrecognized_word:
-        if unrecognized_word not in gv.kg._unrecognized_words:
-            gv.dbg("[UTIL] Added unrecognized word \"{}\"".format(unrecognized_word))
-            gv.kg._unrecognized_words.append(unrecognized_word)
+        if kg.add_unrecognized_word(unrecognized_word):
+            _dbg("[UTIL] Added unrecognized word \"{}\"".format(unrecognized_word))
         return False
     return True
@@ -1,32 +1,82 @@
-import os, sys
+import os, sys, threading
 import fastText
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from valid_detector import ValidDetector
 import gv
 import util
+from timing import timed
 
 model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                           "valid_model.bin")
 
+# The fastText model is read-only, so one copy is shared by every detector.
+_model      = None
+_model_lock = threading.Lock()
+
+
+# Predictions for recent response texts, shared by every detector.
+_predictions = util.LruCache(20000, 'fasttext')
+
+
+def load_model():
+    """ Returns the shared validity model, loading it on first use. """
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = fastText.load_model(model_path)
+    return _model
+
+
+def predict(text):
+    """ Returns the (label, probability) the model predicts for a cleaned text. """
+    prediction = _predictions.get(text)
+    if prediction is None:
+        label, proba = load_model().predict(text)
+        prediction = (label[0], proba[0])
+        _predictions.put(text, prediction)
+    return prediction
+
+
+def predict_batch(texts):
+    """ Predicts the cleaned texts that aren't cached yet in a single call. """
+    missing = list(dict.fromkeys(t for t in texts if t not in _predictions))
+    if missing:
+        labels, probas = load_model().predict(missing)
+        for text, label, proba in zip(missing, labels, probas):
+            _predictions.put(text, (label[0], proba[0]))
+
+
 class LearnedValidDetector(ValidDetector):
     """
     Uses a fastText classifier to predict the validity of the response text.
+    Words the game doesn't recognize are recorded in the knowledge graph kg.
 
     """
-    def __init__(self):
+    def __init__(self, kg):
         super().__init__()
-        self.model = fastText.load_model(model_path)
+        self.kg = kg
+        self.model = load_model()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['model'] # Shared, reloaded on unpickling
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.model = load_model()
 
+    @timed('LearnedValidDetector.action_valid')
     def action_valid(self, action, response_text):
-        if not util.action_recognized(action, response_text):
+        if not util.action_recognized(action, response_text, self.kg):
             return 0.
-        label, proba = self.model.predict(util.clean(response_text))
+        label, proba = predict(util.clean(response_text))
         p_valid = 0
-        if label[0] == '__label__invalid':
-            p_valid = 1-proba[0]
-        elif label[0] == '__label__valid':
-            p_valid = proba[0]
+        if label == '__label__invalid':
+            p_valid = 1-proba
+        elif label == '__label__valid':
+            p_valid = proba
         else:
-            assert False, "Unrecognized Label {}".format(label[0])
+            assert False, "Unrecognized Label {}".format(label)
         # gv.dbg("[LVD]({}) {} p_Valid={:.2f}".format(action, response_text, p_valid))
         return p_valid
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Measures the cost of the Action operations that dominate module elections:
+dictionary probes keyed by actions, equality tests and recognized().
+
+"""
+import argparse
+import os, sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'agent'))
+import util
+from context import AgentContext
+from location import Location
+from entity import Entity
+from action import SingleAction, DoubleAction
+
+parser = argparse.ArgumentParser(description='Measure the per-probe cost of Action lookups.')
+parser.add_argument("--actions", type=int, default=1000,
+                    help="Number of action records in the probed dictionary")
+parser.add_argument("--unrecognized", type=int, default=200,
+                    help="Number of unrecognized words known to the knowledge graph")
+parser.add_argument("--repeat", type=int, default=5,
+                    help="Number of timing repetitions; the best is reported")
+
+VERBS = ['push', 'pull', 'open', 'take', 'eat', 'move', 'examine', 'read']
+
+
+def best_ns(statement, number, repeat):
+    """ Returns the best time per call of statement in nanoseconds. """
+    return min(timeit.repeat(statement, number=number, repeat=repeat)) / number * 1e9
+
+
+def main():
+    args = parser.parse_args()
+    ctx = AgentContext()
+    ctx.event_stream.push = lambda event: None
+    with ctx.activate():
+        run(args, ctx.kg)
+
+
+def run(args, kg):
+    for i in range(args.unrecognized):
+        util.action_recognized("word{}".format(i), 'I don\'t know the word "word{}".'.format(i), kg)
+    loc = Location("Room\nA plain room.")
+    entities = [Entity("thing{}".format(i), loc) for i in range(args.actions // len(VERBS) + 1)]
+    actions = [SingleAction(VERBS[i % len(VERBS)], entities[i // len(VERBS)])
+               for i in range(args.actions)]
+    records = dict((action, (1., '')) for action in actions)
+    # Fresh but equal actions, as the modules construct them on every election.
+    probes = [SingleAction(a.verb, a.entity) for a in actions]
+    doubles = [DoubleAction('put', entities[0], 'in', e) for e in entities]
+
+    number = len(probes)
+    results = [
+        ("dict probe (hit)", best_ns(lambda: [p in records for p in probes], 1, args.repeat) / number),
+        ("equality", best_ns(lambda: [p == a for p, a in zip(probes, actions)], 1, args.repeat) / number),
+        ("recognized()", best_ns(lambda: [p.recognized(kg) for p in probes], 1, args.repeat) / number),
+        ("recognized() double", best_ns(lambda: [d.recognized(kg) for d in doubles], 1, args.repeat) / len(doubles)),
+        ("recognized() fresh", best_ns(lambda: [SingleAction(a.verb, a.entity).recognized(kg) for a in actions],
+                                       1, args.repeat) / number),
+    ]
+    for name, ns in results:
+        print("{:22s} {:8.1f} ns".format(name, ns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the NAIL agent against a local stand-in game.
+
+Runs NailAgent with its real models for a fixed number of steps on a
+ScriptedEnv world, or on a TranscriptEnv replaying a recorded game, and
+reports steps/sec, p50/p99/max step latency and peak memory. The result is
+printed and optionally appended as one JSON line to --output, so that
+runs can be compared across commits.
+
+"""
+import argparse
+import json
+import os, sys
+import resource
+import subprocess
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from agent.nail import NailAgent
+from scripted_env import ScriptedEnv, TranscriptEnv
+
+parser = argparse.ArgumentParser(description='Benchmark the agent end to end on a local game.')
+parser.add_argument("--steps", type=int, default=500,
+                    help="Number of steps to run")
+parser.add_argument("--seed", type=int, default=1010,
+                    help="Random seed of the agent")
+parser.add_argument("--transcript", type=str, default=None,
+                    help="Replay this recorded transcript instead of the scripted world")
+parser.add_argument("--step_budget", type=float, default=None,
+                    help="Run the agent in deadline mode with this many seconds per step")
+parser.add_argument("--timing", action="store_true",
+                    help="Include the agent's per-phase timings in the result")
+parser.add_argument("--output", type=str, default=None,
+                    help="Append the result as a JSON line to this file")
+
+
+def percentile(sorted_values, p):
+    """ Returns the p-th percentile of a sorted list. """
+    index = min(len(sorted_values) - 1, int(round(p / 100. * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def commit():
+    """ Returns the git commit of the tree being benchmarked, if known. """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(agent, env, steps):
+    """ Runs the agent and returns the latency of each step in seconds. """
+    latencies = []
+    obs = env.reset()
+    for _ in range(steps):
+        start = time.perf_counter()
+        action = agent.take_action(obs)
+        new_obs, score, done, info = env.step(action)
+        agent.observe(obs, action, score, new_obs, done)
+        latencies.append(time.perf_counter() - start)
+        obs = env.reset() if done else new_obs
+    return latencies
+
+
+def main():
+    args = parser.parse_args()
+    env = TranscriptEnv(args.transcript) if args.transcript else ScriptedEnv()
+    output_dir = tempfile.mkdtemp(prefix='nail_benchmark_')
+    agent = NailAgent(seed=args.seed, env=env, rom_name='benchmark', output_subdir=output_dir,
+                      timing=args.timing, step_budget=args.step_budget)
+
+    start = time.perf_counter()
+    latencies = run(agent, env, args.steps)
+    wall_time = time.perf_counter() - start
+    agent.finalize()
+
+    latencies.sort()
+    result = {
+        'benchmark': 'agent_end_to_end',
+        'commit': commit(),
+        'env': args.transcript or 'scripted',
+        'seed': args.seed,
+        'steps': args.steps,
+        'wall_time': round(wall_time, 3),
+        'steps_per_sec': round(args.steps / wall_time, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024., 1),
+        'score': env.score,
+        'locations': len(agent.knowledge_graph.locations),
+        'step_budget': args.step_budget,
+        'missed_deadlines': agent.missed_deadlines,
+    }
+    if args.timing:
+        result['phases'] = agent.timings()
+    print(json.dumps(result))
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(result) + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Measures the memory cost of the core knowledge-graph objects.
+
+Builds a synthetic knowledge graph and reports the bytes allocated per
+location, per entity and per action record, as measured by tracemalloc.
+
+"""
+import argparse
+import os, sys
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'agent'))
+import context
+from location import Location
+from entity import Entity
+from action import SingleAction
+
+parser = argparse.ArgumentParser(description='Measure memory per knowledge-graph object.')
+parser.add_argument("--locations", type=int, default=1000,
+                    help="Number of locations to create")
+parser.add_argument("--entities", type=int, default=5,
+                    help="Number of entities per location")
+parser.add_argument("--records", type=int, default=20,
+                    help="Number of action records per entity")
+
+VERBS = ['push', 'pull', 'open', 'take', 'eat', 'move', 'examine', 'read']
+RESPONSES = ["Nothing happens.", "You can't see any such thing.",
+             "That's not something you can open.", "Taken.",
+             "I don't think much is to be gained from that."]
+
+
+def fresh(text):
+    """ Returns a new string object equal to text, as the emulator would. """
+    return ''.join(list(text))
+
+
+def measure(build):
+    """ Returns (bytes allocated by build(), value returned by build()). """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    value = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, value
+
+
+def main():
+    args = parser.parse_args()
+    ctx = context.AgentContext()
+    ctx.event_stream.push = lambda event: None # Keep events out of the measurement
+    with ctx.activate():
+        loc_bytes, locations = measure(lambda: [
+            Location(fresh("Room {}\nA plain room with exits.".format(i)))
+            for i in range(args.locations)])
+
+        def build_entities():
+            entities = []
+            for loc in locations:
+                for j in range(args.entities):
+                    entity = Entity(fresh("thing{}".format(j)), loc)
+                    loc.add_entity(entity)
+                    entities.append(entity)
+            return entities
+        ent_bytes, entities = measure(build_entities)
+
+        def build_records():
+            num = 0
+            for i, entity in enumerate(entities):
+                for j in range(args.records):
+                    action = SingleAction(fresh(VERBS[j % len(VERBS)]), entity)
+                    entity.add_action_record(action, .9, fresh(RESPONSES[(i + j) % len(RESPONSES)]))
+                    num += 1
+            return num
+        rec_bytes, num_records = measure(build_records)
+
+        print("Bytes per location:      {:8.1f}".format(loc_bytes / len(locations)))
+        print("Bytes per entity:        {:8.1f}".format(ent_bytes / len(entities)))
+        print("Bytes per action record: {:8.1f}".format(rec_bytes / num_records))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Procedurally generated worlds of any size for ScriptedEnv, to measure how
+the agent's knowledge graph and navigation scale far beyond real games.
+
+"""
+import random
+
+from scripted_env import ScriptedEnv
+
+OPPOSITE = {'north': 'south', 'south': 'north', 'east': 'west', 'west': 'east',
+            'northeast': 'southwest', 'southwest': 'northeast',
+            'northwest': 'southeast', 'southeast': 'northwest', 'up': 'down', 'down': 'up'}
+
+ROOM_ADJECTIVES = ['Dusty', 'Narrow', 'Grand', 'Damp', 'Quiet', 'Crumbling', 'Gilded', 'Dim',
+                   'Vaulted', 'Cramped', 'Drafty', 'Sunlit', 'Musty', 'Painted', 'Flooded', 'Hidden']
+ROOM_NOUNS = ['Library', 'Corridor', 'Hall', 'Cellar', 'Gallery', 'Chapel', 'Kitchen', 'Study',
+              'Armory', 'Pantry', 'Stairwell', 'Vault', 'Workshop', 'Bedroom', 'Courtyard', 'Attic']
+FEATURES = ['cobwebs hang from the ceiling', 'a faded tapestry covers one wall',
+            'the floorboards creak underfoot', 'water drips somewhere nearby',
+            'a cold draft blows through', 'scratches mark the stone floor',
+            'the smell of smoke lingers', 'shelves line the walls']
+ITEM_ADJECTIVES = ['red', 'blue', 'green', 'old', 'small', 'heavy', 'rusty', 'silver', 'wooden',
+                   'cracked', 'golden', 'dusty', 'torn', 'shiny', 'bent', 'carved']
+ITEM_NOUNS = ['box', 'book', 'lamp', 'bottle', 'statue', 'scroll', 'cup', 'rope', 'coin',
+              'mirror', 'chest', 'candle', 'bell', 'mask', 'shield', 'vase']
+KEY_METALS = ['iron', 'brass', 'copper', 'bronze', 'steel', 'bone', 'glass', 'jade']
+MAZE_TITLE = 'Twisty Passage'
+MAZE_DESCRIPTION = "You are in a maze of twisty little passages, all alike."
+
+
+def procedural_world(rooms=1000, branching=3., entities_per_room=3, locked=0.05,
+                     repetitive=0.1, seed=0):
+    """
+    Returns a world for ScriptedEnv. The rooms are connected by a random
+    spanning tree, so every room can be reached, plus random extra exits.
+
+    @args
+    rooms: Number of rooms
+    branching: Mean number of exits per room, at most 10
+    entities_per_room: Number of items in each room
+    locked: Fraction of the tree's doors that are locked; the key of each
+            is in the room on the start's side of it
+    repetitive: Fraction of the rooms that are maze rooms with the same
+                title and description
+    seed: Random seed of the generator
+
+    """
+    rng = random.Random(seed)
+    names = ['room{}'.format(i) for i in range(rooms)]
+    exits = [{} for _ in range(rooms)]
+    locks = [{} for _ in range(rooms)] # direction : key
+    keys  = [[] for _ in range(rooms)]
+    items = {}
+
+    def connect(a, b, direction):
+        exits[a][direction] = names[b]
+        exits[b][OPPOSITE[direction]] = names[a]
+
+    def free_direction(a, b):
+        free = [d for d in OPPOSITE if d not in exits[a] and OPPOSITE[d] not in exits[b]]
+        return rng.choice(free) if free else None
+
+    # A spanning tree, each room connected to an earlier one.
+    for room in range(1, rooms):
+        for _ in range(10):
+            parent = rng.randrange(room)
+            direction = free_direction(parent, room)
+            if direction:
+                break
+        else:
+            for parent in range(room - 1, -1, -1):
+                direction = free_direction(parent, room)
+                if direction:
+                    break
+        connect(parent, room, direction)
+        if rng.random() < locked:
+            key = '{} key'.format(rng.choice(KEY_METALS))
+            locks[parent][direction] = key
+            items.setdefault(key, {'description': "A small {}.".format(key), 'portable': True})
+            keys[parent].append(key)
+
+    # Extra exits up to the branching factor.
+    extra = max(0, int(rooms * branching / 2) - (rooms - 1))
+    attempts = extra * 2
+    while extra and attempts:
+        attempts -= 1
+        a, b = rng.randrange(rooms), rng.randrange(rooms)
+        direction = free_direction(a, b) if a != b else None
+        if direction:
+            connect(a, b, direction)
+            extra -= 1
+
+    world_rooms = {}
+    for room in range(rooms):
+        room_items = keys[room]
+        for _ in range(entities_per_room):
+            name = '{} {}'.format(rng.choice(ITEM_ADJECTIVES), rng.choice(ITEM_NOUNS))
+            if name not in items:
+                items[name] = {'description': "The {} looks ordinary enough.".format(name),
+                               'portable': rng.random() < .5,
+                               'openable': name.endswith(('box', 'chest'))}
+                if rng.random() < .05:
+                    items[name]['score'] = rng.randint(1, 10)
+            room_items.append(name)
+        if room and rng.random() < repetitive:
+            title, description = MAZE_TITLE, MAZE_DESCRIPTION
+        else:
+            title = '{} {}'.format(rng.choice(ROOM_ADJECTIVES), rng.choice(ROOM_NOUNS))
+            description = "You are in a {}. {}, and {}. Exits lead {}.".format(
+                title.lower(), rng.choice(FEATURES).capitalize(), rng.choice(FEATURES),
+                ', '.join(sorted(exits[room])))
+        world_rooms[names[room]] = {'title': title, 'description': description,
+                                    'exits': exits[room], 'locked': locks[room],
+                                    'items': room_items}
+    return {'start': names[0], 'rooms': world_rooms, 'items': items}
+
+
+class ProceduralEnv(ScriptedEnv):
+    """ Plays a world generated by procedural_world with the given arguments. """
+    def __init__(self, **kwargs):
+        super().__init__(procedural_world(**kwargs))
@@ -0,0 +1,280 @@
+"""
+Deterministic local stand-ins for jericho's FrotzEnv, for benchmarking the
+agent without a Z-machine game. Both expose reset(), step(action),
+get_player_location(), get_state() and set_state(state) like FrotzEnv.
+
+ScriptedEnv plays a small text-adventure world given as a dict.
+TranscriptEnv answers each action with a recorded response.
+procedural_env.ProceduralEnv plays generated worlds of any size.
+
+"""
+import copy
+import json
+
+
+DIRECTIONS = {'n': 'north', 's': 'south', 'e': 'east', 'w': 'west',
+              'ne': 'northeast', 'nw': 'northwest', 'se': 'southeast',
+              'sw': 'southwest', 'u': 'up', 'd': 'down'}
+for _direction in list(DIRECTIONS.values()) + ['enter', 'exit', 'in', 'out']:
+    DIRECTIONS[_direction] = _direction
+
+VERBS = ['look', 'l', 'inventory', 'i', 'take', 'get', 'drop', 'examine', 'x',
+         'open', 'close', 'push', 'pull', 'move', 'read', 'turn', 'on', 'off',
+         'eat', 'all', 'put', 'in', 'with', 'yes', 'no', 'wait', 'climb', 'go']
+
+
+def small_world():
+    """ Returns the default scripted world: a few rooms, items and one trap. """
+    return {
+        'start': 'Front Porch',
+        'rooms': {
+            'Front Porch': {
+                'description': "You are on the front porch of a quiet cottage. A path "
+                               "leads north into a garden and the front door is to the east.",
+                'exits': {'north': 'Garden', 'east': 'Hallway'},
+                'items': ['doormat', 'mailbox'],
+            },
+            'Garden': {
+                'description': "Overgrown flower beds surround a stone fountain. The porch "
+                               "is south of here and a shed stands to the west.",
+                'exits': {'south': 'Front Porch', 'west': 'Shed'},
+                'items': ['fountain', 'coin'],
+            },
+            'Shed': {
+                'description': "The shed is dusty and crowded with old tools. The only "
+                               "way out is east.",
+                'exits': {'east': 'Garden'},
+                'items': ['lantern', 'shovel'],
+            },
+            'Hallway': {
+                'description': "A narrow hallway with creaking floorboards. Doors lead "
+                               "west to the porch, north to a kitchen and down to a cellar.",
+                'exits': {'west': 'Front Porch', 'north': 'Kitchen', 'down': 'Cellar'},
+                'items': ['painting'],
+            },
+            'Kitchen': {
+                'description': "A small kitchen smelling of bread. A cupboard hangs on the "
+                               "wall. The hallway is south.",
+                'exits': {'south': 'Hallway'},
+                'items': ['cupboard', 'bread', 'knife'],
+            },
+            'Cellar': {
+                'description': "It is damp and cold down here. Stairs lead up, and a dark "
+                               "opening gapes to the east.",
+                'exits': {'up': 'Hallway', 'east': 'Pit'},
+                'items': ['barrel', 'ruby'],
+            },
+            'Pit': {
+                'description': "You stumble into a pit in the dark.",
+                'exits': {},
+                'items': [],
+                'deadly': True,
+            },
+        },
+        'items': {
+            'doormat': {'description': "A worn doormat that says WELCOME.", 'portable': True},
+            'mailbox': {'description': "A small dented mailbox.", 'openable': True},
+            'fountain': {'description': "The fountain is dry and full of leaves."},
+            'coin': {'description': "A gold coin glints in the leaves.", 'portable': True,
+                     'score': 5},
+            'lantern': {'description': "A brass lantern.", 'portable': True,
+                        'switchable': True},
+            'shovel': {'description': "A rusty shovel.", 'portable': True},
+            'painting': {'description': "A painting of a stormy sea.", 'portable': True,
+                         'score': 10},
+            'cupboard': {'description': "A pine cupboard.", 'openable': True},
+            'bread': {'description': "A fresh loaf of bread.", 'portable': True,
+                      'edible': True},
+            'knife': {'description': "A bread knife.", 'portable': True},
+            'barrel': {'description': "An old barrel of rainwater."},
+            'ruby': {'description': "A ruby the size of an egg.", 'portable': True,
+                     'score': 15},
+        },
+    }
+
+
+class PlayerLocation:
+    """ The room the player is in, as reported by get_player_location(). """
+    __slots__ = ('num', 'name')
+
+    def __init__(self, num, name):
+        self.num  = num
+        self.name = name
+
+
+class ScriptedEnv:
+    """
+    Plays a scripted world with a tiny parser that understands movement,
+    look, inventory, take, drop, examine, open and close. Taking treasures
+    scores points and entering a deadly room ends the game. Words outside
+    the world's vocabulary get the usual "I don't know the word" response,
+    so the agent's unrecognized-word handling is exercised as well.
+
+    Rooms are keyed by a unique name. A room may have a 'title' shown
+    instead, which several rooms can share, and 'locked' exits
+    {direction: key}, which can only be taken while carrying the key.
+
+    """
+    def __init__(self, world=None):
+        self.world = world or small_world()
+        self._room_nums = dict((name, i + 1) for i, name in enumerate(self.world['rooms']))
+        self._vocabulary = set(VERBS) | set(DIRECTIONS)
+        for name in self.world['items']:
+            self._vocabulary.update(name.split())
+        self.reset()
+
+    def reset(self):
+        self.room      = self.world['start']
+        self.items     = dict((room, list(spec['items']))
+                              for room, spec in self.world['rooms'].items())
+        self.inventory = []
+        self.opened    = set()
+        self.scored    = set()
+        self.score     = 0
+        self.moves     = 0
+        return self.look()
+
+    def get_player_location(self):
+        return PlayerLocation(self._room_nums[self.room],
+                              self.world['rooms'][self.room].get('title', self.room))
+
+    def get_state(self):
+        return copy.deepcopy((self.room, self.items, self.inventory, self.opened,
+                              self.scored, self.score, self.moves))
+
+    def set_state(self, state):
+        (self.room, self.items, self.inventory, self.opened,
+         self.scored, self.score, self.moves) = copy.deepcopy(state)
+
+    def look(self):
+        room = self.world['rooms'][self.room]
+        text = "{}\n{}".format(room.get('title', self.room), room['description'])
+        items = self.items[self.room]
+        if items:
+            text += "\nYou can see {} here.".format(', '.join('a ' + i for i in items))
+        return text
+
+    def step(self, action):
+        self.moves += 1
+        done = False
+        words = action.lower().split()
+        unknown = [w for w in words if w not in self._vocabulary and w != 'the']
+        if not words:
+            obs = "I beg your pardon?"
+        elif unknown:
+            obs = "I don't know the word \"{}\".".format(unknown[0])
+        else:
+            obs, done = self._respond(words)
+        return obs, self.score, done, {'moves': self.moves}
+
+    def _respond(self, words):
+        verb, noun = words[0], ' '.join(w for w in words[1:] if w != 'the')
+        here = self.items[self.room]
+        if verb == 'go' and noun in DIRECTIONS:
+            verb, noun = noun, ''
+        if verb in DIRECTIONS and not noun:
+            room = self.world['rooms'][self.room]
+            destination = room['exits'].get(DIRECTIONS[verb])
+            if destination is None:
+                return "You can't go that way.", False
+            key = room.get('locked', {}).get(DIRECTIONS[verb])
+            if key and key not in self.inventory:
+                return "The door is locked.", False
+            self.room = destination
+            if self.world['rooms'][destination].get('deadly'):
+                return self.look() + "\n\n*** You have died ***", True
+            return self.look(), False
+        if verb in ('look', 'l'):
+            return self.look(), False
+        if verb in ('inventory', 'i'):
+            if not self.inventory:
+                return "You are empty-handed.", False
+            return "You are carrying:\n" + '\n'.join('  a ' + i for i in self.inventory), False
+        if verb in ('take', 'get') and noun == 'all':
+            portable = [i for i in here if self.world['items'][i].get('portable')]
+            if not portable:
+                return "There is nothing here to take.", False
+            return '\n'.join("{}: {}".format(i, self._take(i)) for i in portable), False
+        if not noun:
+            return "What do you want to {}?".format(verb), False
+        if noun not in here and noun not in self.inventory:
+            return "You can't see any such thing.", False
+        item = self.world['items'].get(noun, {})
+        if verb in ('take', 'get'):
+            if noun in self.inventory:
+                return "You already have that.", False
+            return self._take(noun), False
+        if verb == 'drop':
+            if noun not in self.inventory:
+                return "You aren't carrying that.", False
+            self.inventory.remove(noun)
+            here.append(noun)
+            return "Dropped.", False
+        if verb in ('examine', 'x', 'read'):
+            return item['description'], False
+        if verb in ('open', 'close'):
+            if not item.get('openable'):
+                return "That's not something you can {}.".format(verb), False
+            if verb == 'open':
+                self.opened.add(noun)
+                return "Opened.", False
+            self.opened.discard(noun)
+            return "Closed.", False
+        if verb == 'eat' and item.get('edible'):
+            (self.inventory if noun in self.inventory else here).remove(noun)
+            return "Delicious.", False
+        if verb == 'turn' and item.get('switchable'):
+            return "Done.", False
+        return "Nothing happens.", False
+
+    def _take(self, noun):
+        item = self.world['items'][noun]
+        if not item.get('portable'):
+            return "That's fixed in place."
+        self.items[self.room].remove(noun)
+        self.inventory.append(noun)
+        if noun not in self.scored and item.get('score'):
+            self.scored.add(noun)
+            self.score += item['score']
+        return "Taken."
+
+
+class TranscriptEnv:
+    """
+    Replays a recorded game. The transcript is a JSONL file of records
+    {"action": ..., "observation": ..., "score": ..., "done": ...}. The first
+    record, with a null action, is the opening observation. Any action is
+    answered with the response recorded for it, whatever the step; actions
+    that were never recorded get a fixed "That's not a verb I recognise."
+
+    """
+    def __init__(self, path):
+        self._responses = {}
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get('action') is None:
+                    self._opening = record['observation']
+                else:
+                    self._responses[record['action'].lower().strip()] = \
+                        (record['observation'], record.get('score', 0), record.get('done', False))
+        self.score = 0
+
+    def reset(self):
+        self.score = 0
+        return self._opening
+
+    def get_player_location(self):
+        return None
+
+    def get_state(self):
+        return self.score
+
+    def set_state(self, state):
+        self.score = state
+
+    def step(self, action):
+        obs, score, done = self._responses.get(
+            action.lower().strip(), ("That's not a verb I recognise.", self.score, False))
+        self.score = score
+        return obs, score, done, {}
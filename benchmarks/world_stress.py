@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Stress test of the agent on procedurally generated worlds of growing size.
+
+For each world size the agent runs in a fresh process on a ProceduralEnv
+world, so that memory is measured per size. Reported for each size:
+
+- step latency p50/p99/max and peak memory,
+- step latency over windows of the run, against the locations and
+  entities known at the end of each window, which shows the cost of a
+  step growing with the knowledge graph,
+- the time of KnowledgeGraph.match_location and
+  ConnectionGraph.shortest_path on the final knowledge graph, from the
+  start to sampled locations. Calls running over --probe_timeout are
+  stopped and counted, so exponential behaviour shows without hanging.
+
+The results are printed, optionally appended as JSON lines to --output, and
+plotted against world size to --plot if matplotlib is installed.
+
+"""
+import argparse
+import json
+import os, sys
+import random
+import resource
+import signal
+import subprocess
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from agent.nail import NailAgent
+from agent_benchmark import percentile, commit
+from procedural_env import ProceduralEnv
+
+parser = argparse.ArgumentParser(description='Measure how the agent scales with the size of the world.')
+parser.add_argument("--sizes", type=int, nargs='+', default=[100, 1000, 10000],
+                    help="Numbers of rooms of the worlds to run")
+parser.add_argument("--steps", type=int, default=1000,
+                    help="Number of steps to run on each world")
+parser.add_argument("--seed", type=int, default=1010,
+                    help="Random seed of the agent")
+parser.add_argument("--world_seed", type=int, default=0,
+                    help="Random seed of the world generator")
+parser.add_argument("--branching", type=float, default=3.,
+                    help="Mean number of exits per room")
+parser.add_argument("--entities", type=int, default=3,
+                    help="Number of items in each room")
+parser.add_argument("--locked", type=float, default=0.05,
+                    help="Fraction of the doors that are locked")
+parser.add_argument("--repetitive", type=float, default=0.1,
+                    help="Fraction of the rooms that share one title and description")
+parser.add_argument("--windows", type=int, default=10,
+                    help="Number of windows the step latencies are reported over")
+parser.add_argument("--probes", type=int, default=20,
+                    help="Number of locations match_location and shortest_path are timed on")
+parser.add_argument("--probe_timeout", type=float, default=5.,
+                    help="Seconds after which a probe call is stopped")
+parser.add_argument("--output", type=str, default=None,
+                    help="Append the result of each size as a JSON line to this file")
+parser.add_argument("--plot", type=str, default=None,
+                    help="Plot latency and memory against world size to this image")
+parser.add_argument("--size", type=int, default=None,
+                    help=argparse.SUPPRESS) # Runs one size; used by the parent process
+
+
+class ProbeTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise ProbeTimeout()
+
+
+def probe(fn, timeout):
+    """ Returns the seconds fn() takes, or None if it runs over timeout. """
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    start = time.perf_counter()
+    try:
+        fn()
+        return time.perf_counter() - start
+    except ProbeTimeout:
+        return None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def summarize_probes(times):
+    done = [t for t in times if t is not None]
+    return {'mean_ms': round(sum(done) / len(done) * 1000, 3) if done else None,
+            'max_ms': round(max(done) * 1000, 3) if done else None,
+            'timeouts': len(times) - len(done)}
+
+
+def entities_known(kg):
+    return sum(len(location.entities) for location in kg.locations)
+
+
+def run_size(args, rooms):
+    """ Runs the agent on a world of the given size and returns its measurements. """
+    start = time.perf_counter()
+    env = ProceduralEnv(rooms=rooms, branching=args.branching, entities_per_room=args.entities,
+                        locked=args.locked, repetitive=args.repetitive, seed=args.world_seed)
+    build_time = time.perf_counter() - start
+    agent = NailAgent(seed=args.seed, env=env, rom_name='stress',
+                      output_subdir=tempfile.mkdtemp(prefix='nail_stress_'))
+    kg = agent.knowledge_graph
+
+    latencies, windows = [], []
+    window = max(1, args.steps // args.windows)
+    obs = env.reset()
+    start = time.perf_counter()
+    for step in range(args.steps):
+        step_start = time.perf_counter()
+        action = agent.take_action(obs)
+        new_obs, score, done, info = env.step(action)
+        agent.observe(obs, action, score, new_obs, done)
+        latencies.append(time.perf_counter() - step_start)
+        obs = env.reset() if done else new_obs
+        if (step + 1) % window == 0 or step + 1 == args.steps:
+            recent = sorted(latencies[-window:])
+            windows.append({'step': step + 1,
+                            'locations': len(kg.locations),
+                            'entities': entities_known(kg),
+                            'p50_ms': round(percentile(recent, 50) * 1000, 3),
+                            'p99_ms': round(percentile(recent, 99) * 1000, 3)})
+    wall_time = time.perf_counter() - start
+
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    locations = list(kg.locations)
+    samples = random.Random(args.seed).sample(locations, min(args.probes, len(locations)))
+    with agent.ctx.activate():
+        matches = [probe(lambda: kg.match_location(location.description), args.probe_timeout)
+                   for location in samples]
+        paths = [probe(lambda: kg.connections.shortest_path(locations[0], location),
+                       args.probe_timeout) for location in samples]
+    agent.finalize()
+
+    latencies.sort()
+    return {
+        'benchmark': 'world_stress',
+        'commit': commit(),
+        'rooms': rooms,
+        'world_entities': sum(len(room['items']) for room in env.world['rooms'].values()),
+        'branching': args.branching,
+        'locked': args.locked,
+        'repetitive': args.repetitive,
+        'steps': args.steps,
+        'build_time': round(build_time, 3),
+        'steps_per_sec': round(args.steps / wall_time, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024., 1),
+        'locations': len(kg.locations),
+        'entities': entities_known(kg),
+        'windows': windows,
+        'match_location': summarize_probes(matches),
+        'shortest_path': summarize_probes(paths),
+    }
+
+
+def plot(results, path):
+    """ Plots latency and memory against world size to path, if matplotlib is installed. """
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib is not installed, not plotting")
+        return
+    rooms = [r['rooms'] for r in results]
+    fig, axes = plt.subplots(2, 2, figsize=(12, 9))
+    ax = axes[0][0]
+    for field in ('p50_ms', 'p99_ms', 'max_ms'):
+        ax.plot(rooms, [r[field] for r in results], marker='o', label=field)
+    ax.set(xscale='log', yscale='log', xlabel='rooms', ylabel='step latency (ms)')
+    ax.legend()
+    ax = axes[0][1]
+    ax.plot(rooms, [r['peak_rss_mb'] for r in results], marker='o')
+    ax.set(xscale='log', xlabel='rooms', ylabel='peak RSS (MB)')
+    ax = axes[1][0]
+    for r in results:
+        ax.plot([w['locations'] for w in r['windows']], [w['p50_ms'] for w in r['windows']],
+                marker='.', label='{} rooms'.format(r['rooms']))
+    ax.set(xlabel='locations known', ylabel='p50 step latency (ms)')
+    ax.legend()
+    ax = axes[1][1]
+    for name in ('match_location', 'shortest_path'):
+        ax.plot(rooms, [r[name]['max_ms'] for r in results], marker='o', label=name + ' max')
+    ax.set(xscale='log', yscale='log', xlabel='rooms', ylabel='call time (ms)')
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+    print("Plotted to {}".format(path))
+
+
+def main():
+    args = parser.parse_args()
+    if args.size is not None:
+        print(json.dumps(run_size(args, args.size)))
+        return
+
+    results = []
+    for rooms in args.sizes:
+        out = subprocess.run([sys.executable, os.path.abspath(__file__)] + sys.argv[1:] +
+                             ['--size', str(rooms)], stdout=subprocess.PIPE, check=True)
+        result = json.loads(out.stdout.decode().strip().splitlines()[-1])
+        results.append(result)
+        print("rooms={rooms} steps/s={steps_per_sec} p50={p50_ms}ms p99={p99_ms}ms "
+              "max={max_ms}ms rss={peak_rss_mb}MB locations={locations} ".format(**result) +
+              "match_location max={}ms shortest_path max={}ms timeouts={}".format(
+                  result['match_location']['max_ms'], result['shortest_path']['max_ms'],
+                  result['shortest_path']['timeouts']))
+        if args.output:
+            with open(args.output, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+    if args.plot:
+        plot(results, args.plot)
+
+
+if __name__ == "__main__":
+    main()
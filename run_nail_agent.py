@@ -1,10 +1,17 @@
 #!/usr/bin/env python3
 
 import argparse
+import json
 import os, sys
+import time
 
 from jericho import FrotzEnv
 from agent.nail import NailAgent
+# agent.nail puts agent/ on the path. Its modules are imported by the same
+# flat names nail.py uses, so that each is loaded once.
+from checkpoint import latest_checkpoint
+from agent_log import set_levels
+from metrics import MetricsExporter
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -15,42 +22,210 @@ parser.add_argument("--steps", type=int, default=300,
                     help="Number of steps to run")
 parser.add_argument("--seed", type=int, default=1010,
                     help="Random Seed")
-
-
-def main():
-    # Parse the arguments.
-    args = parser.parse_args()
-
-    # Create the environment.
-    env = FrotzEnv(args.game, seed=args.seed)
-
-    # Create the NAIL agent.
-    agent = NailAgent(seed=args.seed, env=env, rom_name=os.path.basename(args.game))
-
+parser.add_argument("--snapshot_kg", action="store_true",
+                    help="Record the knowledge graph changes of every step in kgs/")
+parser.add_argument("--load_kg", type=str, default=None,
+                    help="Warm-start from a knowledge graph saved for this game")
+parser.add_argument("--save_kg", type=str, default=None,
+                    help="Save the final knowledge graph to this path")
+parser.add_argument("--checkpoint_every", type=int, default=0,
+                    help="Checkpoint the agent to checkpoints/ about every this many steps")
+parser.add_argument("--resume", action="store_true",
+                    help="Continue from the latest checkpoint of this game, if there is one")
+parser.add_argument("--step_budget", type=float, default=None,
+                    help="Seconds the agent may take to respond to each observation")
+parser.add_argument("--timing", action="store_true",
+                    help="Time the phases of each step and write them to nail_logs/<game>.timing.json")
+parser.add_argument("--output", type=str, default='text', choices=['text', 'jsonl', 'summary', 'quiet'],
+                    help="What to write about the run: every step as text or as JSON lines, "
+                         "only the final summary, or nothing")
+parser.add_argument("--output_file", type=str, default=None,
+                    help="Write the output to this file instead of stdout")
+parser.add_argument("--max_obs_chars", type=int, default=None,
+                    help="Cut the observations in the output to this many characters, 0 to leave them out")
+parser.add_argument("--log_level", type=str, default='DEBUG',
+                    help="Level of the messages written to nail_logs/<game>.log")
+parser.add_argument("--log_levels", type=str, default=None,
+                    help="Levels of single components, e.g. navigator=INFO,kg=WARNING")
+parser.add_argument("--log_max_mb", type=float, default=0,
+                    help="Rotate the log file once it grows beyond this many megabytes")
+parser.add_argument("--compress_logs", action="store_true",
+                    help="Gzip the rotated log files")
+parser.add_argument("--memory_profile", type=int, default=0,
+                    help="Sample memory with tracemalloc every this many steps and write its growth "
+                         "by subsystem to nail_logs/<game>.memory.json")
+parser.add_argument("--metrics_port", type=int, default=None,
+                    help="Serve live metrics in the Prometheus format on http://127.0.0.1:<port>/metrics")
+parser.add_argument("--metrics_file", type=str, default=None,
+                    help="Periodically rewrite this file with live metrics in the Prometheus format")
+parser.add_argument("--metrics_interval", type=float, default=10.,
+                    help="Seconds between two writes of --metrics_file")
+
+
+def parse_levels(spec):
+    """ Parses component=LEVEL,... into a dict. """
+    levels = {}
+    for item in filter(None, (spec or '').split(',')):
+        component, _, level = item.partition('=')
+        levels[component.strip()] = level.strip().upper()
+    return levels
+
+
+class RunOutput:
+    """
+    Writes the progress of a run through a large buffer, so that writing
+    doesn't hold up the steps when many runs share a node.
+
+    @args
+    mode: 'text' writes every step with its observation, 'jsonl' writes one
+          record per step {"step", "action", "score", "done", "seconds", "obs"},
+          'summary' writes only the final summary line and 'quiet' nothing.
+    path: File to write to; stdout if None
+    max_obs_chars: Observations are cut to this many characters; 0 leaves
+                   them out, None keeps them whole.
+
+    """
+    def __init__(self, mode='text', path=None, max_obs_chars=None, buffer_size=1 << 20):
+        self.mode          = mode
+        self.max_obs_chars = max_obs_chars
+        self._file = None
+        if mode != 'quiet':
+            self._file = open(path if path else sys.stdout.fileno(), 'w',
+                              buffering=buffer_size, closefd=bool(path))
+        # Someone watching a terminal should still see each step.
+        self._flush_steps = mode == 'text' and self._file is not None and self._file.isatty()
+
+    def _obs(self, obs):
+        if self.max_obs_chars is None:
+            return obs
+        return obs[:self.max_obs_chars]
+
+    def step(self, step_num, action, score, done, obs, seconds):
+        if self.mode == 'text':
+            self._file.write("Step {}   Action [{}]   Score {}\n{}\n".format(
+                step_num, action, score, self._obs(obs)))
+            if done:
+                self._file.write("Environment returned done=True. So reset the environment.\n\n")
+            if self._flush_steps:
+                self._file.flush()
+        elif self.mode == 'jsonl':
+            record = {'step': step_num, 'action': action, 'score': score, 'done': done,
+                      'seconds': round(seconds, 6)}
+            if self.max_obs_chars != 0:
+                record['obs'] = self._obs(obs)
+            self._file.write(json.dumps(record) + '\n')
+
+    def summary(self, steps, score, max_score, wall_time, missed_deadlines=None, start_step=0):
+        """
+        Writes the final summary line. Missed deadlines are included if given.
+        Steps/sec counts the steps since start_step, where a resumed run began.
+
+        """
+        if self.mode == 'quiet':
+            return
+        steps_per_sec = round((steps - start_step) / wall_time, 2) if wall_time else 0.
+        if self.mode == 'jsonl':
+            record = {'summary': True, 'steps': steps, 'score': score, 'max_score': max_score,
+                      'wall_time': round(wall_time, 3), 'steps_per_sec': steps_per_sec}
+            if missed_deadlines is not None:
+                record['missed_deadlines'] = missed_deadlines
+            self._file.write(json.dumps(record) + '\n')
+        else:
+            line = "Steps {}   Score {}   MaxScore {}   Time {:.1f}s   Steps/s {}".format(
+                steps, score, max_score, wall_time, steps_per_sec)
+            if missed_deadlines is not None:
+                line += "   MissedDeadlines {}".format(missed_deadlines)
+            self._file.write(line + '\n')
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+
+def run(agent, env, steps, output=None, on_step=None, obs=None):
+    """
+    Runs the agent on the environment until it has taken the given number of
+    steps and returns (final score, best score). The environment is reset on
+    done. Each step and a final summary are written to output, a RunOutput,
+    if given. If given, on_step(step_num, action, score, done) is called
+    after each step. A resumed agent continues from the observation obs.
+
+    """
     # Get the first observation from the environment.
-    obs = env.reset()
+    if obs is None:
+        obs = env.reset()
+    score, max_score = agent.score, agent.max_score
+    start, start_step = time.perf_counter(), agent.step_num
 
     # Run the agent on the environment for the specified number of steps.
-    for step_num in range(args.steps):
+    for step_num in range(start_step, steps):
+        step_start = time.perf_counter()
+
         # Get one action from the agent.
         action = agent.take_action(obs)
 
         # Pass the action to the environment.
         new_obs, score, done, info = env.step(action)
+        max_score = max(max_score, score)
 
         # Update the agent.
         agent.observe(obs, action, score, new_obs, done)
         obs = new_obs
 
         # Output this step.
-        print("Step {}   Action [{}]   Score {}\n{}".format(step_num, action, score, obs))
+        if on_step:
+            on_step(step_num, action, score, done)
+        if output:
+            output.step(step_num, action, score, done, obs, time.perf_counter() - step_start)
 
         # Check for done (such as on death).
         if done:
-            print("Environment returned done=True. So reset the environment.\n")
             obs = env.reset()
+    if output:
+        output.summary(agent.step_num, score, max_score, time.perf_counter() - start,
+                       agent.missed_deadlines if agent.step_budget else None, start_step)
+    return score, max_score
+
+
+def main():
+    # Parse the arguments.
+    args = parser.parse_args()
+
+    # Set how much is logged.
+    set_levels(args.log_level.upper(), parse_levels(args.log_levels))
+
+    # Create the environment.
+    env = FrotzEnv(args.game, seed=args.seed)
+
+    # Create the NAIL agent, or restore it from its latest checkpoint.
+    rom_name = os.path.basename(args.game)
+    checkpoint = latest_checkpoint('checkpoints', rom_name) if args.resume else None
+    if checkpoint:
+        agent, obs = NailAgent.resume(checkpoint, env)
+    else:
+        agent = NailAgent(seed=args.seed, env=env, rom_name=rom_name,
+                          snapshot_kg=args.snapshot_kg, kg_path=args.load_kg, timing=args.timing,
+                          checkpoint_interval=args.checkpoint_every, step_budget=args.step_budget,
+                          log_max_bytes=int(args.log_max_mb * (1 << 20)),
+                          compress_logs=args.compress_logs, memory_interval=args.memory_profile)
+        obs = None
+
+    # Export its live metrics.
+    exporter = None
+    if args.metrics_port is not None or args.metrics_file:
+        exporter = MetricsExporter(args.metrics_file, args.metrics_port, args.metrics_interval)
+        exporter.add(agent)
+
+    # Run the agent.
+    output = RunOutput(args.output, args.output_file, args.max_obs_chars)
+    run(agent, env, args.steps, output=output, obs=obs)
+    output.close()
+    if exporter:
+        exporter.close()
 
     # Clean up the agent.
+    if args.save_kg:
+        agent.save_knowledge_graph(args.save_kg)
     agent.finalize()
 
 
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import argparse
+import os, sys
+import time
+
+from run_nail_lockstep import create_agents, write_results
+# agent.nail puts agent/ on the path. Its modules are imported by the same
+# flat names nail.py uses, so that each is loaded once.
+from async_driver import AsyncDriver
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser(
+    description='Run NAIL agents on many games and seeds concurrently on one event loop.')
+parser.add_argument("games", type=str, nargs='+',
+                    help="Paths to the games to run")
+parser.add_argument("--seeds", type=int, nargs='+', default=[1010],
+                    help="Random seeds to run each game with")
+parser.add_argument("--steps", type=int, default=300,
+                    help="Number of steps to run")
+parser.add_argument("--workers", type=int, default=4,
+                    help="Number of threads running agent steps")
+parser.add_argument("--env_workers", type=int, default=1,
+                    help="Number of threads running emulator steps")
+parser.add_argument("--results", type=str, default='results.jsonl',
+                    help="JSONL file the per-game results are appended to")
+parser.add_argument("--output_dir", type=str, default='batch_output',
+                    help="Directory for the logs of each game")
+
+
+def main():
+    args = parser.parse_args()
+    jobs, agents, envs = create_agents(args.games, args.seeds, args.output_dir)
+    start = time.time()
+    scores = AsyncDriver(args.workers, args.env_workers).run(agents, envs, args.steps)
+    write_results(args.results, jobs, agents, scores, round(time.time() - start, 3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+import argparse
+import gc
+import json
+import multiprocessing
+import os, sys
+import select
+import time
+import traceback
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(description='Run the NAIL agent on many games and seeds.')
+parser.add_argument("games", type=str, nargs='+',
+                    help="Paths to the games to run")
+parser.add_argument("--seeds", type=int, nargs='+', default=[1010],
+                    help="Random seeds to run each game with")
+parser.add_argument("--steps", type=int, default=300,
+                    help="Number of steps to run each job")
+parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                    help="Number of worker processes")
+parser.add_argument("--jobs_per_worker", type=int, default=None,
+                    help="Replace a worker after this many jobs (default: never)")
+parser.add_argument("--results", type=str, default='results.jsonl',
+                    help="JSONL file the per-job results are appended to")
+parser.add_argument("--output_dir", type=str, default='batch_output',
+                    help="Directory for the logs of each job")
+parser.add_argument("--checkpoint_every", type=int, default=0,
+                    help="Checkpoint each job about every this many steps; unfinished jobs resume from them")
+parser.add_argument("--metrics_dir", type=str, default=None,
+                    help="Keep live metrics of each job in <metrics_dir>/<game>_<seed>.prom, "
+                         "in the Prometheus format")
+parser.add_argument("--prefork", action="store_true",
+                    help="Load all models once, then fork a child per job sharing them")
+
+
+def job_key(game, seed):
+    return '{}#{}'.format(game, seed)
+
+
+def finished_jobs(results_path):
+    """ Returns the keys of the jobs that completed in a previous run. """
+    finished = set()
+    if not os.path.exists(results_path):
+        return finished
+    with open(results_path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue # Line cut short by an interruption
+            if result.get('status') == 'ok':
+                finished.add(job_key(result['game'], result['seed']))
+    return finished
+
+
+def unique_memory_mb():
+    """
+    Returns the memory private to this process in MB (its unique set size),
+    or None where /proc is not available. Pages still shared with a
+    pre-fork parent are not counted.
+
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            kb = sum(int(line.split()[1]) for line in f
+                     if line.startswith(('Private_Clean:', 'Private_Dirty:')))
+        return round(kb / 1024., 1)
+    except (IOError, ValueError):
+        return None
+
+
+def preload():
+    """ Loads every read-only resource the agent uses: spaCy, fastText and the LM. """
+    from agent.nail import NailAgent # Loads spaCy through gv
+    from valid_detectors.learned_valid_detector import load_model
+    from affordance_extractors.lm_affordance_extractor import load_language_model
+    load_model()
+    load_language_model()
+
+
+def run_job(job):
+    """
+    Runs one game with one seed in a worker process. Returns its result.
+    A job interrupted in an earlier run continues from its latest checkpoint.
+
+    """
+    game, seed, steps, output_dir, checkpoint_interval, metrics_dir = job
+    rom_name = os.path.basename(game)
+    result = {'game': game, 'rom': rom_name, 'seed': seed, 'steps': 0}
+    start = time.time()
+    first_step = []
+    def on_step(step_num, action, score, done):
+        if not first_step:
+            first_step.append(time.time() - start)
+    try:
+        # Imported here so that the models are loaded once per worker.
+        from jericho import FrotzEnv
+        from agent.nail import NailAgent
+        from checkpoint import latest_checkpoint # By the flat name agent.nail uses
+        from run_nail_agent import run
+        from metrics import MetricsExporter
+        job_dir = os.path.join(output_dir, '{}_{}'.format(rom_name, seed))
+        os.makedirs(job_dir, exist_ok=True)
+        env = FrotzEnv(game, seed=seed)
+        checkpoint = latest_checkpoint(os.path.join(job_dir, 'checkpoints'), rom_name)
+        if checkpoint:
+            agent, obs = NailAgent.resume(checkpoint, env)
+            result['resumed_from'] = agent.step_num
+        else:
+            agent = NailAgent(seed=seed, env=env, rom_name=rom_name, output_subdir=job_dir,
+                              checkpoint_interval=checkpoint_interval)
+            obs = None
+        exporter = None
+        if metrics_dir:
+            exporter = MetricsExporter(
+                os.path.join(metrics_dir, '{}_{}.prom'.format(rom_name, seed)))
+            exporter.add(agent)
+        score, max_score = run(agent, env, steps, on_step=on_step, obs=obs)
+        if exporter:
+            exporter.close()
+        agent.finalize()
+        result.update(status='ok', steps=agent.step_num, score=score, max_score=max_score,
+                      locations=len(agent.knowledge_graph.locations))
+    except Exception:
+        result.update(status='error', error=traceback.format_exc())
+    result['wall_time'] = round(time.time() - start, 3)
+    result['time_to_first_step'] = round(first_step[0], 3) if first_step else None
+    result['unique_memory_mb'] = unique_memory_mb()
+    # Only the steps taken by this run count, not those before the checkpoint.
+    steps_run = max(0, result['steps'] - result.get('resumed_from', 0))
+    result['steps_per_sec'] = round(steps_run / result['wall_time'], 2) \
+                              if result['wall_time'] else 0.
+    return result
+
+
+def run_prefork(jobs, workers):
+    """
+    Runs the jobs in forked children of this process, at most workers at a
+    time, and yields their results as they finish. The models are loaded
+    before forking, so every child shares them copy-on-write and starts its
+    game without loading anything.
+
+    """
+    preload()
+    gc.freeze() # Keep the collector from dirtying the shared pages in the children
+    pending = list(reversed(jobs))
+    running = {} # Read end of the result pipe : (pid, job)
+    while pending or running:
+        while pending and len(running) < workers:
+            job = pending.pop()
+            read_fd, write_fd = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_fd)
+                try:
+                    result = run_job(job)
+                    with os.fdopen(write_fd, 'w') as f:
+                        f.write(json.dumps(result))
+                finally:
+                    os._exit(0)
+            os.close(write_fd)
+            running[read_fd] = (pid, job)
+        ready, _, _ = select.select(list(running), [], [])
+        for read_fd in ready:
+            pid, job = running.pop(read_fd)
+            with os.fdopen(read_fd) as f:
+                data = f.read()
+            _, status = os.waitpid(pid, 0)
+            if data:
+                yield json.loads(data)
+            else:
+                game, seed = job[:2]
+                yield {'game': game, 'rom': os.path.basename(game), 'seed': seed,
+                       'steps': 0, 'steps_per_sec': 0., 'status': 'error',
+                       'error': 'Child exited with status {}'.format(status)}
+
+
+def summarize(results_path):
+    """ Prints the mean score and throughput of each game over its finished jobs. """
+    by_rom = {}
+    with open(results_path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if result.get('status') == 'ok':
+                by_rom.setdefault(result['rom'], []).append(result)
+    def mean(results, field):
+        values = [r[field] for r in results if r.get(field) is not None]
+        return sum(values) / len(values) if values else float('nan')
+    print("{:20s} {:>5s} {:>10s} {:>10s} {:>10s} {:>12s} {:>10s}".format(
+        'Game', 'Jobs', 'Score', 'MaxScore', 'Steps/s', 'FirstStep/s', 'UniqueMB'))
+    for rom, results in sorted(by_rom.items()):
+        print("{:20s} {:5d} {:10.2f} {:10.2f} {:10.1f} {:12.3f} {:10.1f}".format(
+            rom, len(results), mean(results, 'score'), mean(results, 'max_score'),
+            mean(results, 'steps_per_sec'), mean(results, 'time_to_first_step'),
+            mean(results, 'unique_memory_mb')))
+
+
+def main():
+    args = parser.parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.metrics_dir:
+        os.makedirs(args.metrics_dir, exist_ok=True)
+    finished = finished_jobs(args.results)
+    jobs = [(game, seed, args.steps, args.output_dir, args.checkpoint_every, args.metrics_dir)
+            for game in args.games for seed in args.seeds
+            if job_key(game, seed) not in finished]
+    print("{} jobs to run, {} already finished".format(
+        len(jobs), len(args.games) * len(args.seeds) - len(jobs)))
+
+    workers = min(args.workers, len(jobs)) or 1
+    with open(args.results, 'a') as results_file:
+        if args.prefork:
+            pool = None
+            results = run_prefork(jobs, workers)
+        else:
+            pool = multiprocessing.Pool(workers, maxtasksperchild=args.jobs_per_worker)
+            results = pool.imap_unordered(run_job, jobs)
+        try:
+            for n, result in enumerate(results, 1):
+                results_file.write(json.dumps(result) + '\n')
+                results_file.flush()
+                print("[{}/{}] {} seed={} {} score={} steps/s={}".format(
+                    n, len(jobs), result['rom'], result['seed'], result['status'],
+                    result.get('score'), result['steps_per_sec']))
+            if pool:
+                pool.close()
+        except KeyboardInterrupt:
+            print("Interrupted. Finished jobs are kept in {}".format(args.results))
+            if pool:
+                pool.terminate()
+            raise
+        finally:
+            if pool:
+                pool.join()
+    summarize(args.results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os, sys
+import time
+import traceback
+
+from jericho import FrotzEnv
+from agent.nail import NailAgent
+# agent.nail puts agent/ on the path. Its modules are imported by the same
+# flat names nail.py uses, so that each is loaded once.
+from lockstep import LockstepDriver
+from run_nail_batch import summarize
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser(
+    description='Run NAIL agents on many games and seeds in lockstep in one process.')
+parser.add_argument("games", type=str, nargs='+',
+                    help="Paths to the games to run")
+parser.add_argument("--seeds", type=int, nargs='+', default=[1010],
+                    help="Random seeds to run each game with")
+parser.add_argument("--steps", type=int, default=300,
+                    help="Number of steps to run")
+parser.add_argument("--results", type=str, default='results.jsonl',
+                    help="JSONL file the per-game results are appended to")
+parser.add_argument("--output_dir", type=str, default='batch_output',
+                    help="Directory for the logs of each game")
+
+
+def create_agents(games, seeds, output_dir):
+    """ Creates an environment and an agent for every game and seed. """
+    jobs, agents, envs = [], [], []
+    for game in games:
+        for seed in seeds:
+            rom_name = os.path.basename(game)
+            job_dir = os.path.join(output_dir, '{}_{}'.format(rom_name, seed))
+            os.makedirs(job_dir, exist_ok=True)
+            env = FrotzEnv(game, seed=seed)
+            jobs.append((game, seed))
+            envs.append(env)
+            agents.append(NailAgent(seed=seed, env=env, rom_name=rom_name, output_subdir=job_dir))
+    return jobs, agents, envs
+
+
+def write_results(results_path, jobs, agents, scores, wall_time):
+    """
+    Finalizes the agents, appends their results and prints a summary. A game
+    whose entry in scores is an exception is recorded with status 'error'.
+
+    """
+    with open(results_path, 'a') as results_file:
+        for (game, seed), agent, scored in zip(jobs, agents, scores):
+            result = {'game': game, 'rom': os.path.basename(game), 'seed': seed,
+                      'steps': agent.step_num, 'wall_time': wall_time,
+                      'steps_per_sec': round(agent.step_num / wall_time, 2) if wall_time else 0.}
+            if isinstance(scored, BaseException):
+                result.update(status='error', error=''.join(traceback.format_exception(
+                    type(scored), scored, scored.__traceback__)))
+            else:
+                score, max_score = scored
+                result.update(status='ok', score=score, max_score=max_score,
+                              locations=len(agent.knowledge_graph.locations))
+            try:
+                agent.finalize()
+            except Exception:
+                result.setdefault('error', traceback.format_exc())
+                result['status'] = 'error'
+            results_file.write(json.dumps(result) + '\n')
+    total_steps = sum(agent.step_num for agent in agents)
+    print("{} games, {} steps in {:.1f}s: {:.1f} steps/sec".format(
+        len(jobs), total_steps, wall_time, total_steps / wall_time if wall_time else 0.))
+    summarize(results_path)
+
+
+def main():
+    args = parser.parse_args()
+    jobs, agents, envs = create_agents(args.games, args.seeds, args.output_dir)
+    start = time.time()
+    scores = LockstepDriver(agents, envs).run(args.steps)
+    write_results(args.results, jobs, agents, scores, round(time.time() - start, 3))
+
+
+if __name__ == "__main__":
+    main()